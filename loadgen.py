@@ -0,0 +1,401 @@
+"""
+Нагрузочный генератор для вебхука бота.
+
+Шлёт синтетические (модель пользовательской сессии) или записанные (JSONL,
+по одному Telegram Update на строку) апдейты на WEBHOOK_PATH и считает
+задержки, ошибки и пропускную способность.
+
+Чтобы не ходить в настоящий Telegram, loadgen поднимает заглушку Bot API.
+Бот запускается с TELEGRAM_API_URL, указывающим на неё.
+
+ВНИМАНИЕ: сессии проходят весь сценарий записи, и бот пишет настоящие строки
+в Google-таблицу (ID пользователей от USER_ID_BASE = 9000000000), расходуя
+квоту Sheets API. Запускайте бота только на одноразовой копии таблицы
+(свой GOOGLE_SHEET_ID или EVENTS_JSON), никогда — на рабочей. Поэтому
+обязателен флаг --scratch-sheet:
+
+    GOOGLE_SHEET_ID=<копия> TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+    python loadgen.py --scratch-sheet --target http://127.0.0.1:10000 --secret change_me_please \\
+        --sessions 500 --rate 20 --concurrency 100
+
+Задержки:
+  ack   — от POST до ответа вебхука;
+  reply — от POST до первого вызова Bot API боту этого пользователя
+          (sendMessage / editMessageText / answerCallbackQuery).
+
+Ответ ограничителя запросов (THROTTLED_TEXT) считается ошибкой throttled, а не
+задержкой reply; повторно отклонённые сообщения бот оставляет без ответа —
+они попадают в no_reply. Общий лимит бота по умолчанию 20 апдейтов/с (запас 60),
+и при нагрузке выше измеряется ограничитель, а не бот. Для прогонов поднимите
+лимиты при запуске бота:
+
+    GLOBAL_RATE_LIMIT=1000,3000 RATE_LIMITS='{"*": [50, 100], "/start": [50, 100], "day_": [50, 100], "slot_": [50, 100]}' \\
+        GOOGLE_SHEET_ID=<копия> TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from collections import defaultdict
+
+import aiohttp
+from aiohttp import web
+
+
+DEFAULT_DAYS = "2026-02-12,2026-02-13"
+DEFAULT_TIMES = [f"{h:02d}:{m:02d}" for h in range(10, 20) for m in (0, 30)]
+
+USER_ID_BASE = 9_000_000_000
+
+# Совпадает с THROTTLED_TEXT в main.py (импортировать main нельзя — он поднимает бота).
+THROTTLED_TEXT = "⏳ Слишком много запросов. Подождите немного и попробуйте снова."
+
+
+# =========================
+# STATS
+# =========================
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+class Stats:
+    def __init__(self):
+        self.ack_ms = defaultdict(list)
+        self.reply_ms = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sent = 0
+        self.started = time.perf_counter()
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        lines = [
+            f"Отправлено апдейтов: {self.sent} за {elapsed:.1f} с "
+            f"({self.sent / elapsed if elapsed else 0:.1f} апдейтов/с)",
+            f"Ошибок: {sum(self.errors.values())} "
+            f"({100 * sum(self.errors.values()) / self.sent if self.sent else 0:.2f}%)",
+        ]
+        for kind, count in sorted(self.errors.items()):
+            lines.append(f"  {kind}: {count}")
+
+        def table(title, data):
+            lines.append("")
+            lines.append(f"{title:<28} {'n':>6} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+            everything = [v for values in data.values() for v in values]
+            for label, values in sorted(data.items()) + [("ВСЕГО", everything)]:
+                lines.append(
+                    f"{label:<28} {len(values):>6} "
+                    + " ".join(f"{percentile(values, p):>8.1f}" for p in (50, 90, 95, 99, 100))
+                )
+
+        table("ack, мс", self.ack_ms)
+        table("reply, мс", self.reply_ms)
+        return "\n".join(lines)
+
+
+# =========================
+# FAKE BOT API
+# =========================
+class FakeBotAPI:
+    """
+    Заглушка Bot API: отвечает ok на любой метод и сообщает генератору,
+    что бот ответил пользователю (по chat_id / callback_query_id).
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.waiters = defaultdict(list)  # user_id -> [Future]
+        self.callback_users = {}  # callback_query_id -> user_id (заполняет post_update)
+        self.calls = defaultdict(int)
+        self._message_ids = itertools.count(1)
+
+    def expect_reply(self, user_id: int) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters[user_id].append(fut)
+        return fut
+
+    def track_callback(self, callback_query_id, user_id: int):
+        """ID колбэков в записанных апдейтах — обычные числа, поэтому не разбираем их, а запоминаем."""
+        self.callback_users[str(callback_query_id)] = user_id
+
+    def _resolve(self, user_id: int, throttled: bool):
+        for fut in self.waiters.pop(user_id, []):
+            if not fut.done():
+                fut.set_result((time.perf_counter(), throttled))
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        user_id = None
+        if "chat_id" in params:
+            user_id = int(params["chat_id"])
+        elif "callback_query_id" in params:
+            user_id = self.callback_users.pop(str(params["callback_query_id"]), None)
+        if user_id is not None:
+            self._resolve(user_id, THROTTLED_TEXT in str(params.get("text", "")))
+
+        result = True
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "loadgen", "username": "loadgen_bot"}
+        elif method == "sendMessage":
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": str(params.get("text", "")),
+            }
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host=host, port=port).start()
+        return runner
+
+
+# =========================
+# UPDATES
+# =========================
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(random.randint(1, 10**6))
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"Load{user_id % 100000}"}
+
+    def _chat(self, user_id: int) -> dict:
+        return {"id": user_id, "type": "private"}
+
+    def message(self, user_id: int, text: str) -> dict:
+        msg = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(user_id),
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"update_id": next(self._update_ids), "message": msg}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": f"cq-{user_id}-{next(self._callback_ids)}",
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": self._chat(user_id),
+                    "from": {"id": 1, "is_bot": True, "first_name": "loadgen"},
+                    "text": "…",
+                },
+            },
+        }
+
+    def renumber(self, update: dict) -> dict:
+        update = dict(update)
+        update["update_id"] = next(self._update_ids)
+        return update
+
+
+def update_label(update: dict) -> str:
+    if "message" in update:
+        text = update["message"].get("text") or ""
+        return f"message:{text.split()[0] if text.startswith('/') else 'text'}"
+    if "callback_query" in update:
+        return f"callback:{update['callback_query'].get('data', '').split('_', 1)[0]}"
+    return "other"
+
+
+def update_user_id(update: dict):
+    for key in ("message", "callback_query"):
+        if key in update:
+            return update[key].get("from", {}).get("id")
+    return None
+
+
+def session_steps(factory: UpdateFactory, user_id: int, days: list[str], args) -> list[dict]:
+    """Реалистичная сессия: /start <мероприятие> → день → слот → имя → телефон → (отмена | перенос)."""
+    ev = args.event
+    day = random.choice(days)
+    steps = [
+        factory.message(user_id, f"/start {ev}"),
+        factory.callback(user_id, f"day_{ev}_{day}"),
+        factory.callback(user_id, f"slot_{ev}_{day}_{random.choice(DEFAULT_TIMES)}"),
+        factory.message(user_id, f"Тест {user_id % 100000}"),
+        factory.message(user_id, f"7999{random.randint(0, 9_999_999):07d}"),
+    ]
+    roll = random.random()
+    if roll < args.p_cancel:
+        steps.append(factory.callback(user_id, f"cancel_booking_{ev}"))
+    elif roll < args.p_cancel + args.p_change:
+        new_day = random.choice(days)
+        steps += [
+            factory.callback(user_id, f"change_booking_{ev}"),
+            factory.callback(user_id, f"day_{ev}_{new_day}"),
+            factory.callback(user_id, f"slot_{ev}_{new_day}_{random.choice(DEFAULT_TIMES)}"),
+        ]
+    return steps
+
+
+# =========================
+# DRIVER
+# =========================
+async def post_update(http: aiohttp.ClientSession, url: str, update: dict, fake: FakeBotAPI, stats: Stats, args):
+    label = update_label(update)
+    user_id = update_user_id(update)
+    reply = fake.expect_reply(user_id) if fake and user_id is not None else None
+    if fake and user_id is not None and "callback_query" in update:
+        fake.track_callback(update["callback_query"]["id"], user_id)
+
+    stats.sent += 1
+    started = time.perf_counter()
+    try:
+        async with http.post(url, json=update) as resp:
+            await resp.read()
+            if resp.status != 200:
+                stats.errors[f"http_{resp.status}"] += 1
+                return
+        stats.ack_ms[label].append((time.perf_counter() - started) * 1000)
+    except Exception as e:
+        stats.errors[type(e).__name__] += 1
+        return
+
+    if reply is None:
+        return
+    try:
+        replied_at, throttled = await asyncio.wait_for(reply, timeout=args.reply_timeout)
+        if throttled:
+            stats.errors["throttled"] += 1
+        else:
+            stats.reply_ms[label].append((replied_at - started) * 1000)
+    except asyncio.TimeoutError:
+        fake.waiters.pop(user_id, None)
+        stats.errors["no_reply"] += 1
+    finally:
+        if "callback_query" in update:
+            fake.callback_users.pop(str(update["callback_query"]["id"]), None)
+
+
+async def run_sessions(http, url, fake, stats, args):
+    days = [d.strip() for d in args.days.split(",") if d.strip()]
+    factory = UpdateFactory()
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one_session(n: int):
+        async with limit:
+            user_id = USER_ID_BASE + n
+            for update in session_steps(factory, user_id, days, args):
+                await post_update(http, url, update, fake, stats, args)
+                if args.think_ms:
+                    await asyncio.sleep(random.expovariate(1000 / args.think_ms))
+
+    tasks = []
+    for n in range(args.sessions):
+        tasks.append(asyncio.create_task(one_session(n)))
+        await asyncio.sleep(random.expovariate(args.rate))  # пуассоновский поток сессий
+    await asyncio.gather(*tasks)
+
+
+async def run_replay(http, url, fake, stats, args):
+    factory = UpdateFactory()
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(update: dict):
+        async with limit:
+            await post_update(http, url, update, fake, stats, args)
+
+    tasks = []
+    with open(args.replay, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            update = json.loads(line)
+            if not args.keep_update_ids:
+                update = factory.renumber(update)
+            tasks.append(asyncio.create_task(one(update)))
+            await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*tasks)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный генератор для вебхука бота")
+    parser.add_argument(
+        "--scratch-sheet", action="store_true",
+        help="подтверждение: бот работает на одноразовой таблице (loadgen пишет в неё записи)",
+    )
+    parser.add_argument("--target", default="http://127.0.0.1:10000", help="адрес aiohttp-приложения бота")
+    parser.add_argument("--secret", default="change_me_please", help="WEBHOOK_SECRET бота")
+    parser.add_argument("--replay", help="JSONL с записанными апдейтами (вместо синтетических сессий)")
+    parser.add_argument("--keep-update-ids", action="store_true", help="не перенумеровывать update_id при replay")
+    parser.add_argument("--sessions", type=int, default=100, help="число синтетических сессий")
+    parser.add_argument("--rate", type=float, default=10.0, help="сессий/с (или апдейтов/с при --replay)")
+    parser.add_argument("--concurrency", type=int, default=50, help="максимум одновременных сессий / запросов")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="средняя пауза пользователя между шагами")
+    parser.add_argument("--event", default="default", help="ключ мероприятия (/start <ключ>)")
+    parser.add_argument("--days", default=DEFAULT_DAYS, help="дни мероприятия через запятую")
+    parser.add_argument("--p-cancel", type=float, default=0.1, help="доля сессий с отменой")
+    parser.add_argument("--p-change", type=float, default=0.1, help="доля сессий с переносом")
+    parser.add_argument("--reply-timeout", type=float, default=30.0, help="сколько ждать ответа бота, с")
+    parser.add_argument("--bot-api-host", default="127.0.0.1")
+    parser.add_argument("--bot-api-port", type=int, default=8081, help="порт заглушки Bot API (0 — не поднимать)")
+    parser.add_argument("--bot-api-latency-ms", type=float, default=0.0, help="искусственная задержка заглушки")
+    args = parser.parse_args()
+    if not args.scratch_sheet:
+        parser.error(
+            "loadgen создаёт настоящие записи в таблице бота. Запустите бота на одноразовой "
+            "таблице (GOOGLE_SHEET_ID / EVENTS_JSON) и добавьте --scratch-sheet."
+        )
+
+    fake = None
+    runner = None
+    if args.bot_api_port:
+        fake = FakeBotAPI(latency_ms=args.bot_api_latency_ms)
+        runner = await fake.start(args.bot_api_host, args.bot_api_port)
+        print(f"Bot API stand-in: http://{args.bot_api_host}:{args.bot_api_port}")
+
+    url = f"{args.target.rstrip('/')}/webhook/{args.secret}"
+    stats = Stats()
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as http:
+            if args.replay:
+                await run_replay(http, url, fake, stats, args)
+            else:
+                await run_sessions(http, url, fake, stats, args)
+    finally:
+        if runner:
+            await runner.cleanup()
+
+    print(stats.report())
+    if fake:
+        print("\nВызовы Bot API: " + ", ".join(f"{m}={n}" for m, n in sorted(fake.calls.items())))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,31 @@
 import os
+import re
+import hmac
 import json
+import random
 import asyncio
-from datetime import datetime, time, date
+import threading
+import cProfile
+import pstats
+import contextvars
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, time, date, timedelta
+from time import perf_counter, monotonic, sleep
 from zoneinfo import ZoneInfo
 
 import gspread
 from aiohttp import web
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
 
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
+from aiogram import Bot, Dispatcher, BaseMiddleware, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.state import State, StatesGroup
@@ -31,8 +46,19 @@ PORT = int(os.getenv("PORT", "10000"))
 
 ADMIN_USER_ID = os.getenv("ADMIN_USER_ID")  # numeric telegram id as string
 
-if not all([BOT_TOKEN, GOOGLE_SHEET_ID, CREDENTIALS_JSON]):
-    raise ValueError("Не заданы переменные окружения: BOT_TOKEN / GOOGLE_SHEET_ID / GOOGLE_SHEETS_CREDENTIALS")
+# Свой Bot API сервер (например, заглушка из loadgen.py для нагрузочных тестов)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Несколько мероприятий в одном процессе: JSON-список (файл или переменная).
+# Без них работает одно мероприятие «default» на GOOGLE_SHEET_ID.
+EVENTS_CONFIG = os.getenv("EVENTS_CONFIG")
+EVENTS_JSON = os.getenv("EVENTS_JSON")
+
+if not all([BOT_TOKEN, CREDENTIALS_JSON]) or not (GOOGLE_SHEET_ID or EVENTS_CONFIG or EVENTS_JSON):
+    raise ValueError(
+        "Не заданы переменные окружения: BOT_TOKEN / GOOGLE_SHEETS_CREDENTIALS / "
+        "GOOGLE_SHEET_ID (или EVENTS_CONFIG / EVENTS_JSON)"
+    )
 
 if not BASE_URL:
     raise ValueError("Не задан BASE_URL (или RENDER_EXTERNAL_URL). Пример: https://your-service.onrender.com")
@@ -50,10 +76,460 @@ if not ADMIN_USER_ID:
 # TIMEZONE / REMINDER
 # =========================
 TZ = ZoneInfo("Europe/Berlin")
-REMINDER_DAY = date(2026, 2, 10)
+REMINDER_DAY = date(2026, 2, 10)  # мероприятие по умолчанию
 REMINDER_TIME_LOCAL = time(10, 0)  # 10:00 по Берлину
 
 
+# =========================
+# PROFILING (opt-in)
+# =========================
+# Включается через PROFILE_ENABLED=1 или командой /profile on.
+# Для выбранной доли апдейтов строится дерево спанов:
+# апдейт → хендлер → каждый вызов gspread / googleapiclient / Bot API.
+PROFILING = {
+    "enabled": os.getenv("PROFILE_ENABLED", "0") == "1",
+    "sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", "1.0")),
+    "slow_ms": float(os.getenv("PROFILE_SLOW_MS", "1000")),
+    "cprofile": os.getenv("PROFILE_CPROFILE", "0") == "1",
+}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+RECENT_SLOW_TRACES = deque(maxlen=20)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+# Профили вызовов из пула потоков (run_blocking) профилируемого апдейта:
+# cProfile видит только свой поток, а вся работа с Google идёт в пуле.
+_thread_profiles = contextvars.ContextVar("thread_profiles", default=None)
+_cprofile_busy = False
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "children", "meta")
+
+    def __init__(self, name: str, **meta):
+        self.name = name
+        self.start = perf_counter()
+        self.end = None
+        self.children = []
+        self.meta = meta
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else perf_counter()
+        return (end - self.start) * 1000
+
+
+@contextmanager
+def span(name: str, **meta):
+    """
+    Дочерний спан текущего апдейта. Если апдейт не попал в выборку —
+    ничего не делает и отдаёт None.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    s = Span(name, **meta)
+    parent.children.append(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.meta["error"] = type(e).__name__
+        raise
+    finally:
+        s.end = perf_counter()
+        _current_span.reset(token)
+
+
+def _payload_size(obj) -> int:
+    if obj is None:
+        return 0
+    if isinstance(obj, (bytes, str)):
+        return len(obj)
+    try:
+        return len(json.dumps(obj, ensure_ascii=False, default=str))
+    except Exception:
+        return 0
+
+
+def format_span_tree(root: Span) -> str:
+    lines = []
+
+    def walk(s: Span, depth: int):
+        meta = " ".join(f"{k}={v}" for k, v in s.meta.items())
+        lines.append(f"{'  ' * depth}{s.name}  {s.duration_ms:.1f} ms  {meta}".rstrip())
+        for child in s.children:
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return "\n".join(lines)
+
+
+def collapsed_stacks(root: Span) -> list[str]:
+    """Строки в формате collapsed-stack (flamegraph.pl / speedscope): 'a;b;c <мкс>'."""
+    out = []
+
+    def walk(s: Span, prefix: str):
+        path = f"{prefix};{s.name}" if prefix else s.name
+        children_ms = sum(c.duration_ms for c in s.children)
+        self_us = max(0, int((s.duration_ms - children_ms) * 1000))
+        if self_us:
+            out.append(f"{path.replace(' ', '_')} {self_us}")
+        for child in s.children:
+            walk(child, path)
+
+    walk(root, "")
+    return out
+
+
+def _dump_profile(root: Span, profiler, thread_profiles):
+    """Только для медленных апдейтов; вызывается в отдельном потоке, не в event loop."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, "spans.folded"), "a", encoding="utf-8") as f:
+        for line in collapsed_stacks(root):
+            f.write(line + "\n")
+
+    if profiler is not None:
+        stats = pstats.Stats(profiler)
+        if thread_profiles:
+            stats.add(*thread_profiles)
+        stamp = datetime.now(TZ).strftime("%Y%m%d-%H%M%S-%f")
+        stats.dump_stats(os.path.join(PROFILE_DIR, f"{stamp}.prof"))
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: выборка, корневой спан, лог медленных запросов."""
+
+    async def __call__(self, handler, event, data):
+        global _cprofile_busy
+
+        if not PROFILING["enabled"] or random.random() >= PROFILING["sample_rate"]:
+            return await handler(event, data)
+
+        root = Span(f"update:{_update_label(event)}", update_id=event.update_id)
+        token = _current_span.set(root)
+
+        # cProfile профилирует весь поток, включая чужие задачи event loop,
+        # поэтому одновременно держим не больше одного профайлера.
+        profiler = None
+        thread_profiles = None
+        profiles_token = None
+        if PROFILING["cprofile"] and not _cprofile_busy:
+            _cprofile_busy = True
+            profiler = cProfile.Profile()
+            thread_profiles = []
+            profiles_token = _thread_profiles.set(thread_profiles)
+            profiler.enable()
+
+        try:
+            return await handler(event, data)
+        finally:
+            root.end = perf_counter()
+            _current_span.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _thread_profiles.reset(profiles_token)
+                _cprofile_busy = False
+
+            if root.duration_ms >= PROFILING["slow_ms"]:
+                RECENT_SLOW_TRACES.append(root)
+                print(f"[profile] slow update {root.duration_ms:.0f} ms\n{format_span_tree(root)}")
+                try:
+                    await asyncio.to_thread(_dump_profile, root, profiler, thread_profiles)
+                except Exception as e:
+                    print(f"[profile] dump error: {e}")
+
+
+class HandlerSpanMiddleware(BaseMiddleware):
+    """Inner-middleware: спан с именем конкретного хендлера."""
+
+    async def __call__(self, handler, event, data):
+        handler_obj = data.get("handler")
+        name = getattr(getattr(handler_obj, "callback", None), "__name__", "handler")
+        with span(name):
+            return await handler(event, data)
+
+
+class ProfilingRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: спан на каждый вызов Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        with span(f"bot.{type(method).__name__}") as s:
+            if s is not None:
+                try:
+                    s.meta["req_bytes"] = len(method.model_dump_json(exclude_none=True))
+                except Exception:
+                    pass
+            response = await make_request(bot, method)
+            if s is not None:
+                try:
+                    s.meta["resp_bytes"] = len(response.model_dump_json(exclude_none=True))
+                except Exception:
+                    pass
+            return response
+
+
+class ProfiledHttpRequest(HttpRequest):
+    """requestBuilder для googleapiclient: спан на каждый execute()."""
+
+    def execute(self, http=None, num_retries=0):
+        with span(f"sheets_api.{self.methodId}") as s:
+            result = super().execute(http=http, num_retries=num_retries)
+            if s is not None:
+                s.meta["req_bytes"] = _payload_size(self.body)
+                s.meta["resp_bytes"] = _payload_size(result)
+            return result
+
+
+class ProfiledGspread:
+    """Прокси над объектами gspread (Spreadsheet / Worksheet): спан на каждый вызов метода."""
+
+    def __init__(self, worksheet):
+        self._ws = worksheet
+
+    def __getattr__(self, name):
+        attr = getattr(self._ws, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            with span(f"gspread.{name}") as s:
+                result = attr(*args, **kwargs)
+                if s is not None:
+                    s.meta["req_bytes"] = _payload_size(args or None)
+                    s.meta["resp_bytes"] = _payload_size(result)
+                return result
+
+        return wrapper
+
+
+def _update_label(update: types.Update) -> str:
+    if update.message and update.message.text:
+        text = update.message.text
+        return f"message:{text.split()[0] if text.startswith('/') else 'text'}"
+    if update.callback_query and update.callback_query.data:
+        return f"callback:{update.callback_query.data.split('_', 1)[0]}"
+    return update.event_type
+
+
+# =========================
+# UPDATE DEDUPE (идемпотентность)
+# =========================
+# Telegram повторяет доставку вебхука, если мы отвечаем медленно. Повтор
+# подтверждаем сразу и не гоняем хендлеры второй раз (лишние чтения таблицы,
+# дубли append_row).
+DEDUPE_MAX_SIZE = int(os.getenv("DEDUPE_MAX_SIZE", "10000"))
+DEDUPE_TTL = float(os.getenv("DEDUPE_TTL", "3600"))  # сек
+DEDUPE_STORE_PATH = os.getenv("DEDUPE_STORE_PATH")  # json-файл, чтобы пережить рестарт
+DEDUPE_FLUSH_INTERVAL = 30  # сек
+
+
+class SeenUpdates:
+    """Ограниченное по размеру и TTL множество ключей принятых апдейтов (порядок вставки = порядок времени)."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.duplicates = 0
+        self.dirty = False
+        self._seen = OrderedDict()  # key -> unix time
+
+    def _expire(self, now: float):
+        while self._seen:
+            key, ts = next(iter(self._seen.items()))
+            if now - ts <= self.ttl and len(self._seen) <= self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def add_if_new(self, *keys: str) -> bool:
+        """False — хотя бы один ключ уже видели (повторная доставка)."""
+        now = datetime.now(TZ).timestamp()
+        self._expire(now)
+        if any(k in self._seen for k in keys):
+            self.duplicates += 1
+            return False
+        for k in keys:
+            self._seen[k] = now
+        self._expire(now)
+        self.dirty = True
+        return True
+
+    def load(self, path: str):
+        try:
+            with open(path, encoding="utf-8") as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        self._seen = OrderedDict((k, ts) for k, ts in sorted(items, key=lambda kv: kv[1]))
+        self._expire(datetime.now(TZ).timestamp())
+
+    def save(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(self._seen.items()), f)
+        os.replace(tmp, path)
+        self.dirty = False
+
+
+SEEN_UPDATES = SeenUpdates(DEDUPE_MAX_SIZE, DEDUPE_TTL)
+
+
+class DedupeMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: повторно доставленный апдейт не доходит до хендлеров."""
+
+    async def __call__(self, handler, event, data):
+        keys = [f"u:{event.update_id}"]
+        if event.callback_query:
+            keys.append(f"cq:{event.callback_query.id}")
+        if not SEEN_UPDATES.add_if_new(*keys):
+            return None
+        return await handler(event, data)
+
+
+async def dedupe_flush_loop():
+    while True:
+        await asyncio.sleep(DEDUPE_FLUSH_INTERVAL)
+        if SEEN_UPDATES.dirty:
+            try:
+                SEEN_UPDATES.save(DEDUPE_STORE_PATH)
+            except Exception as e:
+                print(f"[dedupe] save error: {e}")
+
+
+# =========================
+# RATE LIMITING
+# =========================
+# Token bucket на пользователя и правило + общий bucket на весь бот,
+# чтобы один пользователь не выжигал квоту Google Sheets.
+# Правило — команда ("/start") или префикс callback_data ("day_", "slot_");
+# значение — [токенов в секунду, ёмкость]; "*" — всё остальное.
+DEFAULT_RATE_LIMITS = {
+    "*": [1.0, 10],
+    "/start": [0.2, 3],
+    "day_": [0.5, 5],
+    "slot_": [0.5, 5],
+}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.getenv("RATE_LIMITS", "{}"))}
+GLOBAL_RATE_LIMIT = [float(x) for x in os.getenv("GLOBAL_RATE_LIMIT", "20,60").split(",")]  # rate,burst
+RATE_LIMIT_IDLE_TTL = float(os.getenv("RATE_LIMIT_IDLE_TTL", "600"))  # сек: забываем неактивных
+RATE_LIMIT_SWEEP_INTERVAL = 60  # сек
+
+THROTTLED_TEXT = "⏳ Слишком много запросов. Подождите немного и попробуйте снова."
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "warned")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.warned = False
+
+    def take(self) -> bool:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.warned = False
+            return True
+        return False
+
+    def ready(self) -> bool:
+        """Есть ли токен — без расхода."""
+        return min(self.capacity, self.tokens + (monotonic() - self.updated) * self.rate) >= 1
+
+    def give_back(self):
+        """Вернуть токен, если запрос всё-таки не пропустили дальше."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class RateLimiter:
+    """O(число правил) памяти на активного пользователя; простаивающие удаляются."""
+
+    def __init__(self, limits: dict, global_limit: list[float], idle_ttl: float):
+        self.limits = limits
+        self.prefixes = sorted((k for k in limits if k != "*" and not k.startswith("/")), key=len, reverse=True)
+        self.global_bucket = TokenBucket(*global_limit)
+        self.idle_ttl = idle_ttl
+        self.buckets = {}  # (user_id, правило) -> TokenBucket
+        self.throttled = 0
+        self._swept_at = monotonic()
+
+    def rule_for_message(self, text: str) -> str:
+        if text.startswith("/"):
+            command = text.split()[0].split("@")[0]
+            if command in self.limits:
+                return command
+        return "*"
+
+    def rule_for_callback(self, data: str) -> str:
+        for prefix in self.prefixes:
+            if data.startswith(prefix):
+                return prefix
+        return "*"
+
+    def _sweep(self):
+        now = monotonic()
+        if now - self._swept_at < RATE_LIMIT_SWEEP_INTERVAL:
+            return
+        self._swept_at = now
+        for key in [k for k, b in self.buckets.items() if now - b.updated > self.idle_ttl]:
+            del self.buckets[key]
+
+    def check(self, user_id: int, rule: str):
+        """None — пропускаем; иначе bucket, который отказал (для однократного предупреждения)."""
+        self._sweep()
+        bucket = self.buckets.get((user_id, rule))
+        if bucket is None:
+            bucket = self.buckets[(user_id, rule)] = TokenBucket(*self.limits[rule])
+        if not bucket.take():
+            self.throttled += 1
+            return bucket
+        if not self.global_bucket.take():
+            # отказ общего лимита не должен съедать личный лимит пользователя
+            bucket.give_back()
+            self.throttled += 1
+            return bucket
+        return None
+
+
+RATE_LIMITER = RateLimiter(RATE_LIMITS, GLOBAL_RATE_LIMIT, RATE_LIMIT_IDLE_TTL)
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Outer-middleware сообщений и callback-ов: отказ до фильтров и хендлеров."""
+
+    async def __call__(self, handler, event, data):
+        user = event.from_user
+        if user is None or is_admin(user.id):
+            return await handler(event, data)
+
+        if isinstance(event, types.CallbackQuery):
+            rule = RATE_LIMITER.rule_for_callback(event.data or "")
+        else:
+            rule = RATE_LIMITER.rule_for_message(event.text or "")
+
+        denied = RATE_LIMITER.check(user.id, rule)
+        if denied is None:
+            return await handler(event, data)
+
+        # Дешёвый ответ: всплывашка на callback, на сообщения — один раз за серию.
+        try:
+            if isinstance(event, types.CallbackQuery):
+                await event.answer(THROTTLED_TEXT)
+            elif not denied.warned:
+                denied.warned = True
+                await event.answer(THROTTLED_TEXT)
+        except Exception as e:
+            print(f"[rate limit] reply error: {e}")
+        return None
+
+
 # =========================
 # GOOGLE AUTH / SERVICES
 # =========================
@@ -67,12 +543,71 @@ def get_creds():
         ],
     )
 
-def get_sheet_gspread():
-    client = gspread.authorize(get_creds())
-    return client.open_by_key(GOOGLE_SHEET_ID).sheet1
+# Один клиент gspread (и его HTTP-сессия) на все мероприятия.
+_gspread_client = None
+
+
+def get_gspread_client():
+    global _gspread_client
+    if _gspread_client is None:
+        _gspread_client = gspread.authorize(get_creds())
+    return _gspread_client
+
+
+def get_spreadsheet(ev):
+    if ev.spreadsheet is None:
+        with span("gspread.open"):
+            ev.spreadsheet = ProfiledGspread(get_gspread_client().open_by_key(ev.sheet_id))
+    return ev.spreadsheet
+
+
+def get_sheet_gspread(ev):
+    """Первый лист таблицы — старая общая таблица записей (до разбиения по дням)."""
+    return ProfiledGspread(get_spreadsheet(ev).sheet1)
+
+
+# Общий пул потоков для блокирующих вызовов Google API из event loop.
+SHEETS_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SHEETS_WORKERS", "4")),
+    thread_name_prefix="sheets",
+)
+
+
+def _profiled_call(profiles: list, fn, *args):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return fn(*args)
+    finally:
+        profiler.disable()
+        profiles.append(profiler)
+
+
+async def run_blocking(fn, *args):
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    profiles = _thread_profiles.get()
+    if profiles is not None:
+        # Апдейт под cProfile — профилируем и вызов в потоке пула.
+        return await loop.run_in_executor(SHEETS_EXECUTOR, ctx.run, _profiled_call, profiles, fn, *args)
+    return await loop.run_in_executor(SHEETS_EXECUTOR, ctx.run, fn, *args)
+
+
+_sheets_service_local = threading.local()
+
 
 def get_sheets_service():
-    return build("sheets", "v4", credentials=get_creds(), cache_discovery=False)
+    """Клиент Sheets API — один на поток (httplib2 не потокобезопасен)."""
+    svc = getattr(_sheets_service_local, "svc", None)
+    if svc is None:
+        svc = build(
+            "sheets", "v4",
+            credentials=get_creds(),
+            cache_discovery=False,
+            requestBuilder=ProfiledHttpRequest,
+        )
+        _sheets_service_local.svc = svc
+    return svc
 
 
 # =========================
@@ -118,91 +653,239 @@ STATUS_PENDING = "Ждёт подтверждения"
 OCCUPYING_STATUSES = {STATUS_BOOKED, STATUS_PENDING}
 
 
-def ensure_sheet_headers_ru_and_format():
+def ensure_sheet_headers_ru_and_format(ev, worksheets: list):
     """
-    1) Делает заголовки русскими (перезаписывает строку 1).
-    2) Красиво форматирует лист: жирный заголовок, заливка, закрепление строки,
+    1) Делает заголовки русскими (перезаписывает строку 1) на каждом листе.
+    2) Красиво форматирует листы: жирный заголовок, заливка, закрепление строки,
        авто-ширина колонок, фильтр по заголовкам.
+    Всё одним values.batchUpdate и одним spreadsheets.batchUpdate.
     """
-    sheet = get_sheet_gspread()
-    sheet.update(values=[HEADERS_RU], range_name="A1:H1")
-
-    svc = get_sheets_service()
-    spreadsheet = svc.spreadsheets().get(spreadsheetId=GOOGLE_SHEET_ID).execute()
-    sheets = spreadsheet.get("sheets", [])
-    if not sheets:
+    if not worksheets:
         return
 
-    sheet_id = sheets[0]["properties"]["sheetId"]
+    get_spreadsheet(ev).values_batch_update({
+        "valueInputOption": "RAW",
+        "data": [
+            {"range": f"'{ws.title}'!A1:H1", "values": [HEADERS_RU]}
+            for ws in worksheets
+        ],
+    })
 
     requests = []
+    for ws in worksheets:
+        sheet_id = ws.id
 
-    # Freeze header row
-    requests.append({
-        "updateSheetProperties": {
-            "properties": {
-                "sheetId": sheet_id,
-                "gridProperties": {"frozenRowCount": 1}
-            },
-            "fields": "gridProperties.frozenRowCount"
-        }
-    })
-
-    # Header styling A1:H1
-    requests.append({
-        "repeatCell": {
-            "range": {
-                "sheetId": sheet_id,
-                "startRowIndex": 0,
-                "endRowIndex": 1,
-                "startColumnIndex": 0,
-                "endColumnIndex": 8
-            },
-            "cell": {
-                "userEnteredFormat": {
-                    "textFormat": {"bold": True},
-                    "horizontalAlignment": "CENTER",
-                    "verticalAlignment": "MIDDLE",
-                    "backgroundColor": {"red": 0.95, "green": 0.95, "blue": 0.95}
-                }
-            },
-            "fields": "userEnteredFormat(textFormat,horizontalAlignment,verticalAlignment,backgroundColor)"
-        }
-    })
+        # Freeze header row
+        requests.append({
+            "updateSheetProperties": {
+                "properties": {
+                    "sheetId": sheet_id,
+                    "gridProperties": {"frozenRowCount": 1}
+                },
+                "fields": "gridProperties.frozenRowCount"
+            }
+        })
 
-    # Filter over columns A..H
-    requests.append({
-        "setBasicFilter": {
-            "filter": {
+        # Header styling A1:H1
+        requests.append({
+            "repeatCell": {
                 "range": {
                     "sheetId": sheet_id,
                     "startRowIndex": 0,
-                    "endRowIndex": 1_000_000,
+                    "endRowIndex": 1,
                     "startColumnIndex": 0,
                     "endColumnIndex": 8
+                },
+                "cell": {
+                    "userEnteredFormat": {
+                        "textFormat": {"bold": True},
+                        "horizontalAlignment": "CENTER",
+                        "verticalAlignment": "MIDDLE",
+                        "backgroundColor": {"red": 0.95, "green": 0.95, "blue": 0.95}
+                    }
+                },
+                "fields": "userEnteredFormat(textFormat,horizontalAlignment,verticalAlignment,backgroundColor)"
+            }
+        })
+
+        # Filter over columns A..H
+        requests.append({
+            "setBasicFilter": {
+                "filter": {
+                    "range": {
+                        "sheetId": sheet_id,
+                        "startRowIndex": 0,
+                        "endRowIndex": 1_000_000,
+                        "startColumnIndex": 0,
+                        "endColumnIndex": 8
+                    }
                 }
             }
-        }
-    })
+        })
 
-    # Auto resize columns A..H
-    requests.append({
-        "autoResizeDimensions": {
-            "dimensions": {
-                "sheetId": sheet_id,
-                "dimension": "COLUMNS",
-                "startIndex": 0,
-                "endIndex": 8
+        # Auto resize columns A..H
+        requests.append({
+            "autoResizeDimensions": {
+                "dimensions": {
+                    "sheetId": sheet_id,
+                    "dimension": "COLUMNS",
+                    "startIndex": 0,
+                    "endIndex": 8
+                }
             }
-        }
-    })
+        })
 
-    svc.spreadsheets().batchUpdate(
-        spreadsheetId=GOOGLE_SHEET_ID,
+    get_sheets_service().spreadsheets().batchUpdate(
+        spreadsheetId=ev.sheet_id,
         body={"requests": requests}
     ).execute()
 
 
+# =========================
+# PARTITIONS (один лист на день)
+# =========================
+# Записи живут в листах, названных по дате (H_DATE), например «2026-02-12».
+# Чтения и поиск трогают только нужные листы; прошедшие дни уезжают
+# в архивную таблицу мероприятия, чтобы рабочая таблица оставалась маленькой.
+ARCHIVE_SHEET_ID = os.getenv("ARCHIVE_SHEET_ID")  # архив мероприятия по умолчанию
+ARCHIVE_CHECK_INTERVAL = int(os.getenv("ARCHIVE_CHECK_INTERVAL", "3600"))  # сек
+
+
+def is_partition_title(title: str) -> bool:
+    try:
+        date.fromisoformat(title)
+        return True
+    except ValueError:
+        return False
+
+
+def load_partitions_index(ev):
+    """Перечитывает список листов-партиций (одно чтение метаданных таблицы)."""
+    found = {
+        ws.title: ProfiledGspread(ws)
+        for ws in get_spreadsheet(ev).worksheets()
+        if is_partition_title(ws.title)
+    }
+    for title in set(ev.partitions) - set(found):
+        ev.partitions.pop(title, None)
+    ev.partitions.update(found)
+
+
+def get_partition(ev, date_str: str):
+    """Лист дня; создаётся с заголовками, если его ещё нет."""
+    ws = ev.partitions.get(date_str)
+    if ws is not None:
+        return ws
+
+    try:
+        ws = ProfiledGspread(get_spreadsheet(ev).add_worksheet(title=date_str, rows=1000, cols=len(HEADERS_RU)))
+        ws.update(values=[HEADERS_RU], range_name="A1:H1")
+        ev.partitions[date_str] = ws
+    except gspread.exceptions.APIError:
+        # Лист мог появиться в обход индекса — перечитываем.
+        load_partitions_index(ev)
+        if date_str not in ev.partitions:
+            raise
+    return ev.partitions[date_str]
+
+
+def row_to_record(values: list) -> dict:
+    values = [str(v) for v in values] + [""] * (len(HEADERS_RU) - len(values))
+    return dict(zip(HEADERS_RU, values))
+
+
+def read_partitions(ev, dates) -> dict[str, list[dict]]:
+    """
+    Одно чтение (values.batchGet) нужных партиций:
+    дата -> записи в порядке строк, первая запись — строка 2.
+    """
+    dates = [d for d in dates if d in ev.partitions]
+    if not dates:
+        return {}
+    ev.availability.take_read()
+    resp = get_spreadsheet(ev).values_batch_get([f"'{d}'!A2:H" for d in dates])
+    return {
+        d: [row_to_record(values) for values in vr.get("values", [])]
+        for d, vr in zip(dates, resp.get("valueRanges", []))
+    }
+
+
+def ensure_partitions(ev):
+    """Листы для всех предстоящих дней мероприятия + заголовки/форматирование."""
+    load_partitions_index(ev)
+    today = datetime.now(TZ).date()
+    for d in ev.slots:
+        if date.fromisoformat(d) >= today:
+            get_partition(ev, d)
+    ensure_sheet_headers_ru_and_format(ev, list(ev.partitions.values()))
+
+
+def archive_partition(ev, date_str: str):
+    """Копирует лист дня в архивную таблицу и удаляет его из рабочей."""
+    ws = ev.partitions[date_str]
+    svc = get_sheets_service()
+    copied = svc.spreadsheets().sheets().copyTo(
+        spreadsheetId=ev.sheet_id,
+        sheetId=ws.id,
+        body={"destinationSpreadsheetId": ev.archive_sheet_id},
+    ).execute()
+
+    try:
+        svc.spreadsheets().batchUpdate(
+            spreadsheetId=ev.archive_sheet_id,
+            body={"requests": [{
+                "updateSheetProperties": {
+                    "properties": {"sheetId": copied["sheetId"], "title": date_str},
+                    "fields": "title",
+                }
+            }]}
+        ).execute()
+    except Exception as e:
+        # Лист с таким названием уже есть в архиве — оставляем «Копия …».
+        print(f"[archive] {ev.key} rename {date_str} error: {e}")
+
+    get_spreadsheet(ev).del_worksheet(ws)
+    ev.partitions.pop(date_str, None)
+
+
+def archive_finished_days(ev) -> list[str]:
+    """Архивирует все партиции дней до сегодняшнего (по Берлину)."""
+    load_partitions_index(ev)
+    today = datetime.now(TZ).date()
+    archived = []
+    for d in sorted(ev.partitions):
+        if date.fromisoformat(d) < today:
+            archive_partition(ev, d)
+            archived.append(d)
+    return archived
+
+
+def migrate_sheet1_to_partitions(ev) -> tuple[int, int]:
+    """
+    Разовый перенос старой общей таблицы (первый лист) по листам дней.
+    Один spreadsheets.batchUpdate: appendCells в партиции + удаление перенесённых строк.
+    Возвращает (перенесено, пропущено без корректной даты).
+    """
+    legacy = get_sheet_gspread(ev)
+    if is_partition_title(legacy.title):
+        return 0, 0
+
+    groups, migrated, skipped = {}, [], 0
+    for idx, values in enumerate(legacy.get_all_values()[1:], start=2):
+        row = row_to_record(values)
+        d = row[H_DATE].strip()
+        if not is_partition_title(d):
+            skipped += 1
+            continue
+        groups.setdefault(d, []).append([row[h] for h in HEADERS_RU])
+        migrated.append(idx)
+
+    requests = [append_rows_request(get_partition(ev, d).id, rows) for d, rows in groups.items()]
+    requests += delete_rows_requests(legacy.id, migrated)
+    batch_update_sheet(ev, requests)
+    return len(migrated), skipped
+
+
 # =========================
 # FSM
 # =========================
@@ -214,10 +897,24 @@ class BookingStates(StatesGroup):
 # =========================
 # BOT / DISPATCHER
 # =========================
-bot = Bot(token=BOT_TOKEN)
+if TELEGRAM_API_URL:
+    bot = Bot(
+        token=BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL.rstrip("/"))),
+    )
+else:
+    bot = Bot(token=BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+dp.update.outer_middleware(DedupeMiddleware())
+dp.update.outer_middleware(ProfilingMiddleware())
+dp.message.outer_middleware(RateLimitMiddleware())
+dp.callback_query.outer_middleware(RateLimitMiddleware())
+dp.message.middleware(HandlerSpanMiddleware())
+dp.callback_query.middleware(HandlerSpanMiddleware())
+bot.session.middleware(ProfilingRequestMiddleware())
+
 
 # =========================
 # EVENT / SLOTS
@@ -240,237 +937,1103 @@ EVENT_INFO = (
 )
 
 
-def days_keyboard() -> InlineKeyboardMarkup:
+DEFAULT_DAY_LABELS = {
+    "2026-02-12": "Четверг, 12 февраля",
+    "2026-02-13": "Пятница, 13 февраля",
+}
+
+
+def days_keyboard(ev) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=ev.day_labels.get(d, d), callback_data=f"day_{ev.key}_{d}")]
+            for d in ev.slots
+        ]
+    )
+
+
+def manage_keyboard(ev) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="🔁 Изменить время", callback_data=f"change_booking_{ev.key}")],
+            [InlineKeyboardButton(text="❌ Отменить запись", callback_data=f"cancel_booking_{ev.key}")],
+        ]
+    )
+
+
+def reminder_keyboard(ev, partition: str, row_index: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="Четверг, 12 февраля", callback_data="day_2026-02-12")],
-            [InlineKeyboardButton(text="Пятница, 13 февраля", callback_data="day_2026-02-13")],
+            [InlineKeyboardButton(text="✅ Подтверждаю", callback_data=f"rem_yes_{ev.key}_{partition}_{row_index}")],
+            [InlineKeyboardButton(text="❌ Отменить запись", callback_data=f"rem_cancel_{ev.key}_{partition}_{row_index}")],
         ]
     )
 
 
-def manage_keyboard() -> InlineKeyboardMarkup:
+def admin_keyboard(ev) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="🔁 Изменить время", callback_data="change_booking")],
-            [InlineKeyboardButton(text="❌ Отменить запись", callback_data="cancel_booking")],
+            [InlineKeyboardButton(text="📣 Разослать напоминания сейчас", callback_data=f"admin_rem_ask_{ev.key}")],
         ]
     )
 
 
-def reminder_keyboard(row_index: int) -> InlineKeyboardMarkup:
+def admin_confirm_keyboard(ev) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Подтверждаю", callback_data=f"rem_yes_{row_index}")],
-            [InlineKeyboardButton(text="❌ Отменить запись", callback_data=f"rem_cancel_{row_index}")],
+            [InlineKeyboardButton(text="✅ Да, разослать", callback_data=f"admin_rem_confirm_{ev.key}")],
+            [InlineKeyboardButton(text="❌ Отмена", callback_data=f"admin_rem_cancel_{ev.key}")],
         ]
     )
 
 
-def admin_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📣 Разослать напоминания сейчас", callback_data="admin_send_reminders")],
-        ]
-    )
+def is_admin(user_id: int) -> bool:
+    if not ADMIN_USER_ID:
+        return False
+    return str(user_id) == str(ADMIN_USER_ID).strip()
+
+
+def booking_info(row: dict) -> dict:
+    """То, что о занятом слоте держим в памяти (без персональных данных)."""
+    return {
+        "status": str(row.get(H_STATUS, "")).strip(),
+        "reminder_sent": bool(str(row.get(H_REMINDER_SENT, "")).strip()),
+        "confirmed": bool(str(row.get(H_ATTENDANCE_CONFIRMED, "")).strip()),
+    }
+
+
+def read_bookings_snapshot(ev) -> tuple[dict[tuple[str, str], dict], dict[str, str]]:
+    """
+    Одно авторитетное чтение всех рабочих партиций мероприятия:
+    ({(дата, время): booking_info}, каталог user_id -> партиция с активной записью).
+    """
+    occupied, directory = {}, {}
+    for partition, records in read_partitions(ev, list(ev.partitions)).items():
+        for row in records:
+            status = str(row.get(H_STATUS, "")).strip()
+            if status not in OCCUPYING_STATUSES:
+                continue
+            directory[str(row.get(H_USER_ID, "")).strip()] = partition
+            date_str = str(row.get(H_DATE, "")).strip()
+            time_str = str(row.get(H_TIME, "")).strip()
+            if date_str in ev.slots and time_str in ev.slots[date_str]:
+                occupied[(date_str, time_str)] = booking_info(row)
+    return occupied, directory
+
+
+# =========================
+# AVAILABILITY CACHE (stale-while-revalidate)
+# =========================
+AVAILABILITY_SOFT_TTL = float(os.getenv("AVAILABILITY_SOFT_TTL", "15"))  # сек: дальше — фоновое обновление
+AVAILABILITY_MAX_STALENESS = float(os.getenv("AVAILABILITY_MAX_STALENESS", "300"))  # сек: дальше — ждём чтения
+AVAILABILITY_RETRY_DELAY = float(os.getenv("AVAILABILITY_RETRY_DELAY", "5"))  # сек: пауза после ошибки чтения
+SHEET_READ_QUOTA_WAIT = float(os.getenv("SHEET_READ_QUOTA_WAIT", "5"))  # сек: сколько чтение ждёт квоту мероприятия
+
+STALE_TEXT = "⏳ Не удаётся получить актуальное расписание. Попробуйте через пару минут."
+
+
+class AvailabilityCache:
+    """
+    Держит последний удачный снимок занятости в slots и его возраст,
+    статусы занятых слотов (bookings) и каталог «пользователь -> партиция»
+    для точечного поиска записей. Каждое изменение увеличивает version.
+
+    Чтения отдаются из снимка сразу; если он старше soft_ttl — запускается
+    одно фоновое обновление. Старше max_staleness — хендлер ждёт обновления.
+    Неудачное чтение не трогает снимок (слоты не «освобождаются» сами по себе).
+
+    loader() — блокирующее чтение снимка; quota (TokenBucket) ограничивает
+    все чтения таблицы мероприятия (take_read), чтобы мероприятия не выедали
+    общую квоту Sheets API; фоновое обновление без свободного токена пропускается.
+    """
+
+    def __init__(self, slots: dict, soft_ttl: float, max_staleness: float, loader, quota=None):
+        self.slots = slots
+        self.loader = loader
+        self.quota = quota
+        self._quota_lock = threading.Lock()  # токены берут потоки пула
+        self.bookings = {}  # (дата, время) -> booking_info
+        self.directory = {}  # user_id -> дата партиции
+        self.version = 0
+        self._changed = asyncio.Event()
+        self.soft_ttl = soft_ttl
+        self.max_staleness = max_staleness
+        self.fetched_at = None  # monotonic()
+        self.retry_at = 0.0
+        self._refresh_task = None
+        self._overrides = None  # локальные изменения, сделанные во время обновления
+        self.last_drift = None  # чем последний снимок разошёлся с памятью
+
+    def age(self):
+        if self.fetched_at is None:
+            return None
+        return monotonic() - self.fetched_at
+
+    def is_fresh(self) -> bool:
+        age = self.age()
+        return age is not None and age <= self.max_staleness
+
+    def notify_changed(self):
+        self.version += 1
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_changed(self, version: int, timeout: float):
+        """Ждёт изменения после version (или таймаута)."""
+        if self.version != version:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _set_booking(self, date_str: str, time_str: str, info):
+        self.slots[date_str][time_str] = info is not None
+        if info is None:
+            self.bookings.pop((date_str, time_str), None)
+        else:
+            self.bookings[(date_str, time_str)] = info
+        if self._overrides is not None:
+            self._overrides[("slot", date_str, time_str)] = info
+        self.notify_changed()
+
+    def set(self, date_str: str, time_str: str, occupied: bool):
+        """Локальное изменение после успешной записи в таблицу."""
+        if date_str in self.slots and time_str in self.slots[date_str]:
+            info = None
+            if occupied:
+                info = self.bookings.get((date_str, time_str)) or {
+                    "status": STATUS_BOOKED, "reminder_sent": False, "confirmed": False,
+                }
+            self._set_booking(date_str, time_str, info)
+
+    def move(self, date_str: str, time_str: str, new_date: str, new_time: str):
+        """Перенос записи на другой слот с её статусом и флагами напоминания."""
+        info = self.bookings.get((date_str, time_str))
+        self.set(date_str, time_str, False)
+        self.set(new_date, new_time, True)
+        if info is not None:
+            self.update_booking(new_date, new_time, **info)
+
+    def update_booking(self, date_str: str, time_str: str, **fields):
+        """Локальная смена статуса / флагов напоминания занятого слота."""
+        info = self.bookings.get((date_str, time_str))
+        if info is not None:
+            self._set_booking(date_str, time_str, {**info, **fields})
+
+    def set_user(self, user_id: str, partition):
+        """partition=None — у пользователя больше нет активной записи."""
+        user_id = str(user_id)
+        if partition is None:
+            self.directory.pop(user_id, None)
+        else:
+            self.directory[user_id] = partition
+        if self._overrides is not None:
+            self._overrides[("user", user_id)] = partition
+
+    def apply(self, snapshot: tuple[dict[tuple[str, str], dict], dict[str, str]]):
+        occupied, directory = snapshot
+        previous, previous_directory = self.bookings, self.directory
+        self.bookings = dict(occupied)
+        self.directory = directory
+        # Прочитанное могло устареть относительно наших же записей во время чтения.
+        for key, value in (self._overrides or {}).items():
+            if key[0] != "slot":
+                if value is None:
+                    self.directory.pop(key[1], None)
+                else:
+                    self.directory[key[1]] = value
+            elif value is None:
+                self.bookings.pop((key[1], key[2]), None)
+            else:
+                self.bookings[(key[1], key[2])] = value
+        for d in self.slots:
+            for t in self.slots[d]:
+                self.slots[d][t] = (d, t) in self.bookings
+        self.fetched_at = monotonic()
+        # Расхождения, которые память не видела (ручные правки таблицы и т.п.).
+        self.last_drift = {
+            "missing": len(self.bookings.keys() - previous.keys()),
+            "phantom": len(previous.keys() - self.bookings.keys()),
+            "status": sum(1 for k in self.bookings.keys() & previous.keys() if self.bookings[k] != previous[k]),
+            "directory": sum(
+                1 for uid in self.directory.keys() | previous_directory.keys()
+                if self.directory.get(uid) != previous_directory.get(uid)
+            ),
+        }
+        if self.bookings != previous:
+            self.notify_changed()
+
+    def _start_refresh(self, loader=None):
+        """Single-flight: все ожидающие делят одно чтение таблицы."""
+        if self._refresh_task is None:
+            self._overrides = {}
+            # Пустой контекст: фоновое чтение не должно попадать в спаны апдейта.
+            self._refresh_task = asyncio.create_task(
+                self._do_refresh(loader or self.loader), context=contextvars.Context()
+            )
+        return self._refresh_task
+
+    async def refresh(self, loader=None):
+        """loader — разовая замена self.loader (сверка): дожидается текущего чтения и читает само."""
+        if loader is not None:
+            while self._refresh_task is not None:
+                await asyncio.shield(self._refresh_task)
+        await asyncio.shield(self._start_refresh(loader))
+
+    async def _do_refresh(self, loader):
+        try:
+            snapshot = await run_blocking(loader)
+            self.apply(snapshot)
+        except Exception as e:
+            self.retry_at = monotonic() + AVAILABILITY_RETRY_DELAY
+            print(f"[availability refresh] error: {e}")
+        finally:
+            self._overrides = None
+            self._refresh_task = None
+
+    def take_read(self, timeout: float = SHEET_READ_QUOTA_WAIT):
+        """
+        Блокирующе (только в потоке пула) ждёт токен на одно чтение таблицы.
+        Не дождались за timeout — RuntimeError: хендлер ответит «попробуйте позже».
+        """
+        if self.quota is None:
+            return
+        deadline = monotonic() + timeout
+        while True:
+            with self._quota_lock:
+                if self.quota.take():
+                    return
+                wait = (1 - self.quota.tokens) / self.quota.rate
+            if monotonic() + wait > deadline:
+                raise RuntimeError("исчерпана квота чтений таблицы мероприятия")
+            sleep(wait)
+
+    async def ensure_fresh(self) -> bool:
+        """
+        False — снимка нет или он старше max_staleness и обновить не удалось:
+        показывать слоты по нему нельзя, хендлер отвечает «попробуйте позже».
+        """
+        age = self.age()
+        if self._refresh_task is None and monotonic() < self.retry_at:
+            return self.is_fresh()  # таблица недавно не ответила — не долбим её снова
+        if age is None or age > self.max_staleness:
+            await self.refresh()
+        elif age > self.soft_ttl and self._refresh_task is None:
+            if self.quota is None or self.quota.ready():
+                self._start_refresh()
+        return self.is_fresh()
+
+
+# =========================
+# EVENTS
+# =========================
+# Одно мероприятие — своя таблица, сетка дней/слотов, напоминание, архив
+# и кэш занятости. Клиент Google, пул потоков и бот общие на весь процесс.
+#
+# EVENTS_CONFIG (путь к файлу) или EVENTS_JSON — список объектов:
+#   {"key": "spring", "sheet_id": "...", "days": {"2026-04-01": "Среда, 1 апреля"},
+#    "start": "10:00", "end": "20:00", "step_min": 30, "info": "...",
+#    "reminder_day": "2026-03-31", "reminder_time": "10:00",
+#    "archive_sheet_id": "...", "sheet_reads_per_min": 60}
+# Ссылка на запись: https://t.me/<бот>?start=spring
+EVENT_KEY_RE = re.compile(r"^[a-z][a-z0-9-]{0,15}$")
+EVENT_SHEET_READS_PER_MIN = float(os.getenv("EVENT_SHEET_READS_PER_MIN", "60"))  # чтения таблицы на мероприятие
+
+
+class Event:
+    def __init__(
+        self,
+        key: str,
+        sheet_id: str,
+        slots: dict,
+        day_labels: dict,
+        info: str,
+        reminder_day: date,
+        reminder_time: time = REMINDER_TIME_LOCAL,
+        archive_sheet_id=None,
+        sheet_reads_per_min: float = EVENT_SHEET_READS_PER_MIN,
+    ):
+        self.key = key
+        self.sheet_id = sheet_id
+        self.slots = slots
+        self.day_labels = day_labels
+        self.info = info
+        self.reminder_day = reminder_day
+        self.reminder_time = reminder_time
+        self.archive_sheet_id = archive_sheet_id
+        self.spreadsheet = None  # открывается лениво
+        self.partitions = {}  # дата -> лист (ProfiledGspread)
+        # Чтение -> правка/удаление строк по номеру — под этим замком, иначе
+        # удаление между ними сдвигает номера и задевает чужие записи.
+        self.rows_lock = asyncio.Lock()
+        self.reminder_status = {"last_run": None, "last_ok": 0, "last_fail": 0}  # итог последней рассылки
+        self.dashboard_cache = {"version": None, "payload": None}
+        self.availability = AvailabilityCache(
+            slots,
+            AVAILABILITY_SOFT_TTL,
+            AVAILABILITY_MAX_STALENESS,
+            loader=lambda: read_bookings_snapshot(self),
+            quota=TokenBucket(sheet_reads_per_min / 60, max(1.0, sheet_reads_per_min / 6)),
+        )
+
+    def __repr__(self):
+        return f"Event({self.key!r})"
+
+
+def build_slots(days, start: str, end: str, step_min: int) -> dict:
+    first, last = (int(x[:2]) * 60 + int(x[3:5]) for x in (start, end))
+    times = [f"{m // 60:02d}:{m % 60:02d}" for m in range(first, last, step_min)]
+    return {d: {t: False for t in times} for d in days}
+
+
+def event_from_config(cfg: dict) -> Event:
+    key = str(cfg["key"])
+    if not EVENT_KEY_RE.match(key):
+        raise ValueError(f"Ключ мероприятия «{key}»: латиница/цифры/дефис, до 16 символов, с буквы")
+
+    day_labels = {str(d): label for d, label in cfg["days"].items()}
+    for d in day_labels:
+        date.fromisoformat(d)
+    start, end, step = cfg.get("start", "10:00"), cfg.get("end", "20:00"), int(cfg.get("step_min", 30))
+
+    first_day = date.fromisoformat(min(day_labels))
+    info = cfg.get("info") or (
+        "🎉 Добро пожаловать на наше мероприятие!\n\n"
+        "📅 Доступные дни:\n"
+        + "".join(f"• {label}\n" for label in day_labels.values())
+        + f"\n🕗 Время: с {start} до {end}\n"
+        f"⏳ Слоты по {step} минут\n"
+        "👥 Один человек на слот\n"
+        "🔒 Один аккаунт = один слот\n\n"
+        "👉 Выберите день ниже:"
+    )
+    return Event(
+        key=key,
+        sheet_id=cfg["sheet_id"],
+        slots=build_slots(day_labels, start, end, step),
+        day_labels=day_labels,
+        info=info,
+        reminder_day=date.fromisoformat(cfg["reminder_day"]) if cfg.get("reminder_day") else first_day - timedelta(days=1),
+        reminder_time=time.fromisoformat(cfg.get("reminder_time", "10:00")),
+        archive_sheet_id=cfg.get("archive_sheet_id"),
+        sheet_reads_per_min=float(cfg.get("sheet_reads_per_min", EVENT_SHEET_READS_PER_MIN)),
+    )
+
+
+def load_events() -> dict[str, Event]:
+    """GOOGLE_SHEET_ID (если задан) — мероприятие «default» + всё из конфига."""
+    configs = []
+    if EVENTS_CONFIG:
+        with open(EVENTS_CONFIG, encoding="utf-8") as f:
+            configs = json.load(f)
+    elif EVENTS_JSON:
+        configs = json.loads(EVENTS_JSON)
+
+    events = {}
+    if GOOGLE_SHEET_ID:
+        events["default"] = Event(
+            "default", GOOGLE_SHEET_ID, SLOTS, DEFAULT_DAY_LABELS, EVENT_INFO,
+            REMINDER_DAY, REMINDER_TIME_LOCAL, ARCHIVE_SHEET_ID,
+        )
+    for cfg in configs:
+        ev = event_from_config(cfg)
+        if ev.key in events:
+            raise ValueError(f"Мероприятие «{ev.key}» описано дважды")
+        if any(other.sheet_id == ev.sheet_id for other in events.values()):
+            raise ValueError(f"Мероприятие «{ev.key}»: таблица уже занята другим мероприятием")
+        events[ev.key] = ev
+    return events
+
+
+EVENTS = load_events()
+DEFAULT_EVENT_KEY = os.getenv("DEFAULT_EVENT") or next(iter(EVENTS))
+if DEFAULT_EVENT_KEY not in EVENTS:
+    raise ValueError(f"DEFAULT_EVENT={DEFAULT_EVENT_KEY}: такого мероприятия нет")
+
+# user_id -> ключ мероприятия из последнего /start <ключ>; самые давние вытесняются.
+USER_EVENTS = OrderedDict()
+USER_EVENTS_MAX = int(os.getenv("USER_EVENTS_MAX", "10000"))
+
+
+def remember_user_event(user_id: str, key: str):
+    USER_EVENTS[user_id] = key
+    USER_EVENTS.move_to_end(user_id)
+    while len(USER_EVENTS) > USER_EVENTS_MAX:
+        USER_EVENTS.popitem(last=False)
+
+
+def event_for_user(user_id) -> Event:
+    """Мероприятие из последней ссылки, иначе то, где есть запись, иначе по умолчанию."""
+    user_id = str(user_id)
+    key = USER_EVENTS.get(user_id)
+    if key in EVENTS:
+        return EVENTS[key]
+    for ev in EVENTS.values():
+        if user_id in ev.availability.directory:
+            return ev
+    return EVENTS[DEFAULT_EVENT_KEY]
+
+
+def parse_event_callback(data: str, prefix: str) -> tuple[Event, list[str]]:
+    """
+    Кнопки несут ключ мероприятия первым полем после префикса: day_<ключ>_<дата>.
+    Кнопки из старых сообщений (без ключа) выпущены ещё однотабличным ботом —
+    они относятся к мероприятию "default" (GOOGLE_SHEET_ID), если оно есть.
+    """
+    rest = data[len(prefix):].lstrip("_")
+    parts = rest.split("_") if rest else []
+    if parts and parts[0] in EVENTS:
+        return EVENTS[parts[0]], parts[1:]
+    return EVENTS.get("default") or EVENTS[DEFAULT_EVENT_KEY], parts
+
+
+def prepare_event(ev: Event):
+    """
+    Листы, форматирование, перенос старого общего листа и первый снимок
+    занятости (блокирующе, для старта). Перенос идемпотентен: перенесённые
+    строки удаляются из общего листа, так что повторный старт ничего не дублирует.
+    """
+    try:
+        ensure_partitions(ev)
+    except Exception as e:
+        print(f"[format sheet] {ev.key} error: {e}")
+    try:
+        migrated, skipped = migrate_sheet1_to_partitions(ev)
+        if migrated or skipped:
+            print(f"[partition_migrate] {ev.key}: перенесено {migrated}, оставлено без даты {skipped}")
+    except Exception as e:
+        print(f"[partition_migrate] {ev.key} error: {e}")
+    return ev.availability.loader()
+
+
+def _find_active_row(partitions: dict[str, list[dict]], user_id: str):
+    for partition, records in partitions.items():
+        for i, row in enumerate(records, start=2):
+            uid = str(row.get(H_USER_ID, "")).strip()
+            status = str(row.get(H_STATUS, "")).strip()
+            if uid == user_id and status in OCCUPYING_STATUSES:
+                return partition, i, row
+    return None, None, None
+
+
+def find_user_active_booking(ev, user_id: str):
+    """
+    Ищет активную запись по ID пользователя (строго 1 аккаунт = 1 слот).
+    Возвращает (партиция, номер строки, запись).
+
+    Читается только партиция из каталога. Если каталога нет в снимке
+    и снимок свежий — записи нет; если снимок устарел — читаются все партиции.
+    Ручные переносы между листами каталог догоняет при обновлении снимка и сверке.
+    Финальная проверка перед записью — commit_new_booking / rebook_row.
+    """
+    user_id = str(user_id)
+    hint = ev.availability.directory.get(user_id)
+    if hint is None and ev.availability.is_fresh():
+        return None, None, None
+
+    if hint in ev.partitions:
+        return _find_active_row(read_partitions(ev, [hint]), user_id)
+
+    return _find_active_row(read_partitions(ev, list(ev.partitions)), user_id)
+
+
+def _slot_taken(partitions: dict[str, list[dict]], date_str: str, time_str: str) -> bool:
+    """Слот занят, если в любой партиции есть активная строка с этими датой и временем."""
+    for records in partitions.values():
+        for row in records:
+            status = str(row.get(H_STATUS, "")).strip()
+            if status in OCCUPYING_STATUSES and str(row.get(H_DATE, "")).strip() == date_str and str(row.get(H_TIME, "")).strip() == time_str:
+                return True
+    return False
+
+
+# =========================
+# ADMIN / UTIL
+# =========================
+@dp.message(Command("myid"))
+async def myid(message: types.Message):
+    await message.answer(f"Ваш Telegram ID: {message.from_user.id}")
+
+
+@dp.message(Command("admin"))
+async def admin_panel(message: types.Message, command: CommandObject):
+    """/admin [ключ мероприятия]"""
+    if not is_admin(message.from_user.id):
+        await message.answer("Эта команда доступна только администратору.")
+        return
+
+    key = (command.args or DEFAULT_EVENT_KEY).strip()
+    ev = EVENTS.get(key)
+    if ev is None:
+        await message.answer(f"Мероприятие «{key}» не найдено. Есть: {', '.join(EVENTS)}")
+        return
+
+    await message.answer(
+        f"🛠 Админ-панель — {ev.key}\n\n"
+        f"Мероприятия: {', '.join(EVENTS)} (/admin <ключ>)\n\n"
+        "Отсюда можно вручную разослать напоминания всем записанным.\n\n"
+        f"{BULK_USAGE}\n\n"
+        "/partition_migrate [@ключ] — перенести записи из старого общего листа по листам дней\n"
+        "/reconcile [fix] [@ключ] — сверить таблицу с памятью (fix — удалить конфликтующие строки)",
+        reply_markup=admin_keyboard(ev)
+    )
+
+
+@dp.message(Command("profile"))
+async def profile_command(message: types.Message):
+    """
+    /profile                — статус и последние медленные апдейты
+    /profile on [доля]      — включить (доля выборки 0..1)
+    /profile off            — выключить
+    /profile slow <мс>      — порог «медленного» апдейта
+    /profile cprofile on|off — дампить cProfile для медленных апдейтов
+    """
+    if not is_admin(message.from_user.id):
+        await message.answer("Эта команда доступна только администратору.")
+        return
+
+    args = (message.text or "").split()[1:]
+    try:
+        if args[:1] == ["on"]:
+            PROFILING["enabled"] = True
+            if len(args) > 1:
+                PROFILING["sample_rate"] = min(1.0, max(0.0, float(args[1])))
+        elif args[:1] == ["off"]:
+            PROFILING["enabled"] = False
+        elif args[:1] == ["slow"] and len(args) > 1:
+            PROFILING["slow_ms"] = float(args[1])
+        elif args[:1] == ["cprofile"] and len(args) > 1:
+            PROFILING["cprofile"] = args[1] == "on"
+        elif args:
+            await message.answer("Использование: /profile [on [доля] | off | slow <мс> | cprofile on|off]")
+            return
+    except ValueError:
+        await message.answer("Неверное число.")
+        return
+
+    recent = "\n".join(
+        f"• {s.name} — {s.duration_ms:.0f} мс" for s in list(RECENT_SLOW_TRACES)[-5:]
+    ) or "—"
+    await message.answer(
+        "🔬 Профилирование\n\n"
+        f"Включено: {'да' if PROFILING['enabled'] else 'нет'}\n"
+        f"Доля выборки: {PROFILING['sample_rate']}\n"
+        f"Порог медленных: {PROFILING['slow_ms']:.0f} мс\n"
+        f"cProfile: {'да' if PROFILING['cprofile'] else 'нет'}\n"
+        f"Дампы: {PROFILE_DIR}/\n\n"
+        f"Последние медленные:\n{recent}"
+    )
+
+
+@dp.callback_query(lambda c: c.data.startswith("admin_rem_ask_"))
+async def admin_send_reminders(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Недостаточно прав.", show_alert=True)
+        return
+    ev, _ = parse_event_callback(callback.data, "admin_rem_ask_")
+
+    await callback.message.edit_text(
+        f"⚠️ Вы уверены, что хотите разослать напоминания всем записанным на «{ev.key}»?\n\n"
+        "Будут отправлены сообщения с кнопками подтверждения/отмены.",
+        reply_markup=admin_confirm_keyboard(ev)
+    )
+
+
+@dp.callback_query(lambda c: c.data.startswith("admin_rem_cancel_"))
+async def admin_send_reminders_cancel(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Недостаточно прав.", show_alert=True)
+        return
+
+    await callback.message.edit_text(
+        "Ок, отменено. Если нужно — нажмите /admin ещё раз."
+    )
+
+
+async def send_reminders_now(ev, force: bool) -> tuple[int, int]:
+    """
+    Рассылает напоминания всем, у кого активная запись на слоты мероприятия.
+    Возвращает (sent_ok, sent_fail).
+
+    force=True: игнорирует 'Напоминание отправлено' (перешлёт даже если уже отправляли).
+    force=False: отправляет только тем, кому ещё не отправляли.
+    Отметка об отправке пишется до рассылки: сбой доставки попадает в sent_fail,
+    повторно такому пользователю напоминание уйдёт только с force=True.
+    """
+    now = datetime.now(TZ)
+    sent_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    sent_ok = 0
+    sent_fail = 0
+    targets = []
+
+    # Строки правятся по номерам: чтение и одна пачка правок (статус + отметка
+    # об отправке) — под замком, сама рассылка — уже без него.
+    async with ev.rows_lock:
+        partitions = await run_blocking(read_partitions, ev, [d for d in ev.slots if d in ev.partitions])
+
+        requests = []
+        for partition, records in partitions.items():
+            sheet_id = ev.partitions[partition].id
+            for idx, row in enumerate(records, start=2):
+                status = str(row.get(H_STATUS, "")).strip()
+                if status not in OCCUPYING_STATUSES:
+                    continue
+
+                d = str(row.get(H_DATE, "")).strip()
+                t = str(row.get(H_TIME, "")).strip()
+                user_id = str(row.get(H_USER_ID, "")).strip()
+
+                # только наши даты/слоты
+                if d not in ev.slots or t not in ev.slots[d] or not user_id:
+                    continue
+
+                reminder_sent = str(row.get(H_REMINDER_SENT, "")).strip()
+                if reminder_sent and not force:
+                    continue
+
+                # Переводим в "ждёт подтверждения", слот всё равно занят;
+                # дату/время отправки пишем всегда (при force — перезаписываем)
+                requests += [
+                    update_cell_request(sheet_id, idx, COL_STATUS, STATUS_PENDING),
+                    update_cell_request(sheet_id, idx, COL_REMINDER_SENT, sent_at),
+                ]
+                targets.append((user_id, d, t, partition, idx))
+
+        try:
+            if requests:
+                await run_blocking(batch_update_sheet, ev, requests)
+        except Exception as e:
+            print(f"[reminder mark] {ev.key} error: {e}")
+            sent_fail = len(targets)
+            targets = []
+
+    for _, d, t, _, _ in targets:
+        ev.availability.update_booking(d, t, status=STATUS_PENDING, reminder_sent=True)
+
+    if targets:
+        sent_ok, sent_fail = await notify_users([
+            (
+                user_id,
+                "🔔 Напоминание о записи!\n\n"
+                f"📅 Дата: {d}\n"
+                f"🕗 Время: {t}\n\n"
+                "Пожалуйста, подтвердите, что вы придёте:\n"
+                "✅ Подтверждаю — всё ок\n"
+                "❌ Отменить — освободим слот для других",
+                reminder_keyboard(ev, partition, idx),
+            )
+            for user_id, d, t, partition, idx in targets
+        ])
+
+    ev.reminder_status.update(last_run=now.isoformat(timespec="seconds"), last_ok=sent_ok, last_fail=sent_fail)
+    ev.availability.notify_changed()
+    return sent_ok, sent_fail
+
+
+@dp.callback_query(lambda c: c.data.startswith("admin_rem_confirm_"))
+async def admin_send_reminders_confirm(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Недостаточно прав.", show_alert=True)
+        return
+    ev, _ = parse_event_callback(callback.data, "admin_rem_confirm_")
+
+    await callback.message.edit_text("⏳ Рассылаю напоминания…")
+
+    try:
+        ok, fail = await send_reminders_now(ev, force=True)
+        await callback.message.edit_text(
+            f"✅ Готово!\n\nОтправлено: {ok}\nНе доставлено: {fail}\n\n"
+            "Если нужно — можно нажать /admin и разослать ещё раз."
+        )
+    except Exception as e:
+        print(f"[admin_send_reminders_confirm] error: {e}")
+        await callback.message.edit_text("❌ Ошибка при рассылке. Посмотрите логи Render.")
+
+
+# =========================
+# ADMIN BULK OPERATIONS
+# =========================
+# Каждая команда: одно чтение таблицы + один spreadsheets.batchUpdate,
+# затем атомарное обновление кэша занятости и пакетная рассылка уведомлений.
+TIME_RANGE_RE = re.compile(r"^(\d{2}:\d{2})-(\d{2}:\d{2})$")
+NOTIFY_RATE_PER_SEC = float(os.getenv("NOTIFY_RATE_PER_SEC", "25"))  # лимит Telegram ~30 сообщений/сек
+
+BULK_STATUS_ALIASES = {
+    "booked": STATUS_BOOKED,
+    "pending": STATUS_PENDING,
+}
+
+BULK_USAGE = (
+    "Массовые операции (интервал времени необязателен, конец не включается):\n\n"
+    "/bulk_move <дата> [ЧЧ:ММ-ЧЧ:ММ] <новая_дата> — перенести записи на другой день (то же время)\n"
+    "/bulk_cancel <дата> [ЧЧ:ММ-ЧЧ:ММ] [pending] — отменить записи (pending — только ждущие подтверждения)\n"
+    "/bulk_status <дата> [ЧЧ:ММ-ЧЧ:ММ] <booked|pending> — сменить статус\n\n"
+    "Для другого мероприятия добавьте @ключ, например: /bulk_cancel @spring 2026-04-01"
+)
+
+
+def pop_event_arg(args: list[str]) -> tuple[Event, list[str]]:
+    """Вынимает из аргументов команды '@ключ' мероприятия (по умолчанию — DEFAULT_EVENT)."""
+    keys = [a[1:] for a in args if a.startswith("@")]
+    if len(keys) > 1 or (keys and keys[0] not in EVENTS):
+        raise ValueError("неизвестное мероприятие")
+    ev = EVENTS[keys[0] if keys else DEFAULT_EVENT_KEY]
+    return ev, [a for a in args if not a.startswith("@")]
+
+
+def parse_bulk_args(text: str):
+    """'/cmd @ev 2026-02-12 10:00-12:00 x y' -> (Event, '2026-02-12', ('10:00', '12:00'), ['x', 'y'])."""
+    ev, args = pop_event_arg((text or "").split()[1:])
+    if not args:
+        raise ValueError("не указана дата")
+    date_str, rest = args[0], args[1:]
+    if date_str not in ev.slots:
+        raise ValueError("неверная дата")
+    time_range = None
+    if rest:
+        m = TIME_RANGE_RE.match(rest[0])
+        if m:
+            time_range = (m.group(1), m.group(2))
+            rest = rest[1:]
+    return ev, date_str, time_range, rest
+
+
+def select_active_rows(records: list[dict], date_str: str, time_range=None, status=None):
+    """[(номер строки в таблице, запись)] активных записей дня / интервала."""
+    selected = []
+    for idx, row in enumerate(records, start=2):
+        row_status = str(row.get(H_STATUS, "")).strip()
+        if row_status not in OCCUPYING_STATUSES:
+            continue
+        if status and row_status != status:
+            continue
+        if str(row.get(H_DATE, "")).strip() != date_str:
+            continue
+        t = str(row.get(H_TIME, "")).strip()
+        if time_range and not (time_range[0] <= t < time_range[1]):
+            continue
+        selected.append((idx, row))
+    return selected
+
+
+def update_cell_request(sheet_id: int, row_index: int, col: int, value: str) -> dict:
+    return {
+        "updateCells": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": row_index - 1,
+                "endRowIndex": row_index,
+                "startColumnIndex": col - 1,
+                "endColumnIndex": col,
+            },
+            "rows": [{"values": [{"userEnteredValue": {"stringValue": value}}]}],
+            "fields": "userEnteredValue",
+        }
+    }
+
+
+def append_rows_request(sheet_id: int, rows: list[list[str]]) -> dict:
+    return {
+        "appendCells": {
+            "sheetId": sheet_id,
+            "rows": [
+                {"values": [{"userEnteredValue": {"stringValue": v}} for v in row]}
+                for row in rows
+            ],
+            "fields": "userEnteredValue",
+        }
+    }
+
+
+def delete_rows_requests(sheet_id: int, row_indexes: list[int]) -> list[dict]:
+    """deleteDimension снизу вверх, соседние строки склеиваются в один диапазон."""
+    requests = []
+    for idx in sorted(set(row_indexes), reverse=True):
+        last = requests[-1]["deleteDimension"]["range"] if requests else None
+        if last and last["startIndex"] == idx:
+            last["startIndex"] = idx - 1
+            continue
+        requests.append({
+            "deleteDimension": {
+                "range": {
+                    "sheetId": sheet_id,
+                    "dimension": "ROWS",
+                    "startIndex": idx - 1,
+                    "endIndex": idx,
+                }
+            }
+        })
+    return requests
+
+
+def batch_update_sheet(ev, requests: list[dict]):
+    if not requests:
+        return
+    get_sheets_service().spreadsheets().batchUpdate(
+        spreadsheetId=ev.sheet_id,
+        body={"requests": requests}
+    ).execute()
+
+
+async def notify_users(messages: list[tuple]) -> tuple[int, int]:
+    """
+    Рассылает [(chat_id, text, reply_markup)] параллельно, но не быстрее
+    NOTIFY_RATE_PER_SEC. Возвращает (sent_ok, sent_fail).
+    """
+    async def send(delay: float, chat_id, text, markup) -> bool:
+        await asyncio.sleep(delay)
+        try:
+            await bot.send_message(chat_id=int(chat_id), text=text, reply_markup=markup)
+            return True
+        except Exception as e:
+            print(f"[notify_users] to {chat_id} failed: {e}")
+            return False
+
+    results = await asyncio.gather(*(
+        send(i / NOTIFY_RATE_PER_SEC, chat_id, text, markup)
+        for i, (chat_id, text, markup) in enumerate(messages)
+    ))
+    ok = sum(results)
+    return ok, len(results) - ok
+
 
+def bulk_move(ev, date_str: str, time_range, new_date: str):
+    """
+    Переносит записи в партицию new_date: appendCells в новый лист
+    и deleteDimension в старом — одним batchUpdate.
+    Возвращает (moved [(user_id, time)], skipped).
+    """
+    source = get_partition(ev, date_str)
+    target = get_partition(ev, new_date)
+    partitions = read_partitions(ev, [date_str, new_date])
 
-def admin_confirm_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Да, разослать", callback_data="admin_send_reminders_confirm")],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="admin_send_reminders_cancel")],
-        ]
-    )
+    taken = {
+        str(row.get(H_TIME, "")).strip()
+        for _, row in select_active_rows(partitions.get(new_date, []), new_date)
+    }
 
+    moved_rows, moved_idx, moved, skipped = [], [], [], 0
+    for idx, row in select_active_rows(partitions.get(date_str, []), date_str, time_range):
+        t = str(row.get(H_TIME, "")).strip()
+        if t not in ev.slots[new_date] or t in taken:
+            skipped += 1
+            continue
+        taken.add(t)
+        moved_rows.append([new_date if h == H_DATE else str(row.get(h, "")) for h in HEADERS_RU])
+        moved_idx.append(idx)
+        moved.append((str(row.get(H_USER_ID, "")).strip(), t))
+
+    if moved_rows:
+        batch_update_sheet(
+            ev,
+            [append_rows_request(target.id, moved_rows)]
+            + delete_rows_requests(source.id, moved_idx)
+        )
+    return moved, skipped
 
-def is_admin(user_id: int) -> bool:
-    if not ADMIN_USER_ID:
-        return False
-    return str(user_id) == str(ADMIN_USER_ID).strip()
 
+def bulk_cancel(ev, date_str: str, time_range, status=None):
+    """Возвращает cancelled [(user_id, time)]."""
+    sheet = get_partition(ev, date_str)
+    records = read_partitions(ev, [date_str]).get(date_str, [])
 
-def reset_slots():
-    for d in SLOTS:
-        for t in SLOTS[d]:
-            SLOTS[d][t] = False
+    selected = select_active_rows(records, date_str, time_range, status)
+    batch_update_sheet(ev, delete_rows_requests(sheet.id, [idx for idx, _ in selected]))
+    return [
+        (str(row.get(H_USER_ID, "")).strip(), str(row.get(H_TIME, "")).strip())
+        for _, row in selected
+    ]
 
 
-def load_bookings_from_sheet():
-    """Пересобирает занятость слотов по русским статусам из таблицы."""
-    try:
-        reset_slots()
-        sheet = get_sheet_gspread()
-        records = sheet.get_all_records()
-        for row in records:
-            status = str(row.get(H_STATUS, "")).strip()
-            if status in OCCUPYING_STATUSES:
-                date_str = str(row.get(H_DATE, "")).strip()
-                time_str = str(row.get(H_TIME, "")).strip()
-                if date_str in SLOTS and time_str in SLOTS[date_str]:
-                    SLOTS[date_str][time_str] = True
-    except Exception as e:
-        print(f"[load_bookings_from_sheet] error: {e}")
-
-
-def find_user_active_booking(user_id: str):
-    """Ищет активную запись по ID пользователя (строго 1 аккаунт = 1 слот)."""
-    sheet = get_sheet_gspread()
-    records = sheet.get_all_records()
-    for i, row in enumerate(records, start=2):
-        uid = str(row.get(H_USER_ID, "")).strip()
-        status = str(row.get(H_STATUS, "")).strip()
-        if uid == str(user_id) and status in OCCUPYING_STATUSES:
-            return i, row
-    return None, None
-
-
-def slot_is_occupied_in_sheet(date_str: str, time_str: str) -> bool:
-    sheet = get_sheet_gspread()
-    records = sheet.get_all_records()
-    for row in records:
-        status = str(row.get(H_STATUS, "")).strip()
-        if status in OCCUPYING_STATUSES and str(row.get(H_DATE, "")).strip() == date_str and str(row.get(H_TIME, "")).strip() == time_str:
-            return True
-    return False
+def bulk_set_status(ev, date_str: str, time_range, new_status: str) -> tuple[list[str], int]:
+    """Возвращает (changed [time], unchanged)."""
+    sheet = get_partition(ev, date_str)
+    records = read_partitions(ev, [date_str]).get(date_str, [])
 
+    requests, changed, unchanged = [], [], 0
+    for idx, row in select_active_rows(records, date_str, time_range):
+        if str(row.get(H_STATUS, "")).strip() == new_status:
+            unchanged += 1
+            continue
+        requests.append(update_cell_request(sheet.id, idx, COL_STATUS, new_status))
+        changed.append(str(row.get(H_TIME, "")).strip())
 
-# =========================
-# ADMIN / UTIL
-# =========================
-@dp.message(Command("myid"))
-async def myid(message: types.Message):
-    await message.answer(f"Ваш Telegram ID: {message.from_user.id}")
+    batch_update_sheet(ev, requests)
+    return changed, unchanged
 
 
-@dp.message(Command("admin"))
-async def admin_panel(message: types.Message):
+@dp.message(Command("bulk_move"))
+async def bulk_move_command(message: types.Message):
     if not is_admin(message.from_user.id):
         await message.answer("Эта команда доступна только администратору.")
         return
 
-    await message.answer(
-        "🛠 Админ-панель\n\n"
-        "Отсюда можно вручную разослать напоминания всем записанным.",
-        reply_markup=admin_keyboard()
-    )
-
-
-@dp.callback_query(lambda c: c.data == "admin_send_reminders")
-async def admin_send_reminders(callback: types.CallbackQuery):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Недостаточно прав.", show_alert=True)
+    try:
+        ev, date_str, time_range, rest = parse_bulk_args(message.text)
+        if len(rest) != 1 or rest[0] not in ev.slots or rest[0] == date_str:
+            raise ValueError("неверная новая дата")
+    except ValueError:
+        await message.answer(BULK_USAGE)
         return
+    new_date = rest[0]
 
-    await callback.message.edit_text(
-        "⚠️ Вы уверены, что хотите разослать напоминания всем записанным?\n\n"
-        "Будут отправлены сообщения с кнопками подтверждения/отмены.",
-        reply_markup=admin_confirm_keyboard()
-    )
-
-
-@dp.callback_query(lambda c: c.data == "admin_send_reminders_cancel")
-async def admin_send_reminders_cancel(callback: types.CallbackQuery):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Недостаточно прав.", show_alert=True)
+    await message.answer("⏳ Переношу записи…")
+    try:
+        async with ev.rows_lock:
+            moved, skipped = await run_blocking(bulk_move, ev, date_str, time_range, new_date)
+    except Exception as e:
+        print(f"[bulk_move] error: {e}")
+        await message.answer("❌ Ошибка при переносе. Таблица не изменена.")
         return
 
-    await callback.message.edit_text(
-        "Ок, отменено. Если нужно — нажмите /admin ещё раз."
+    for user_id, t in moved:
+        ev.availability.move(date_str, t, new_date, t)
+        ev.availability.set_user(user_id, new_date)
+
+    ok, fail = await notify_users([
+        (
+            user_id,
+            "🔁 Ваша запись перенесена организатором.\n\n"
+            f"📅 Новая дата: {new_date}\n"
+            f"🕗 Время: {t}",
+            manage_keyboard(ev),
+        )
+        for user_id, t in moved
+    ])
+    await message.answer(
+        f"✅ Перенесено: {len(moved)}\n"
+        f"Пропущено (время занято или отсутствует): {skipped}\n"
+        f"Уведомлено: {ok}, не доставлено: {fail}"
     )
 
 
-async def send_reminders_now(force: bool) -> tuple[int, int]:
-    """
-    Рассылает напоминания всем, у кого активная запись на наши слоты.
-    Возвращает (sent_ok, sent_fail).
-
-    force=True: игнорирует 'Напоминание отправлено' (перешлёт даже если уже отправляли).
-    force=False: отправляет только тем, кому ещё не отправляли.
-    """
-    sent_ok = 0
-    sent_fail = 0
+@dp.message(Command("bulk_cancel"))
+async def bulk_cancel_command(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("Эта команда доступна только администратору.")
+        return
 
-    sheet = get_sheet_gspread()
-    records = sheet.get_all_records()
+    try:
+        ev, date_str, time_range, rest = parse_bulk_args(message.text)
+        if rest not in ([], ["pending"]):
+            raise ValueError("неверный фильтр")
+    except ValueError:
+        await message.answer(BULK_USAGE)
+        return
+    status = STATUS_PENDING if rest else None
 
-    now = datetime.now(TZ)
+    await message.answer("⏳ Отменяю записи…")
+    try:
+        async with ev.rows_lock:
+            cancelled = await run_blocking(bulk_cancel, ev, date_str, time_range, status)
+    except Exception as e:
+        print(f"[bulk_cancel] error: {e}")
+        await message.answer("❌ Ошибка при отмене. Таблица не изменена.")
+        return
 
-    for idx, row in enumerate(records, start=2):
-        status = str(row.get(H_STATUS, "")).strip()
-        if status not in OCCUPYING_STATUSES:
-            continue
+    for user_id, t in cancelled:
+        ev.availability.set(date_str, t, False)
+        ev.availability.set_user(user_id, None)
 
-        d = str(row.get(H_DATE, "")).strip()
-        t = str(row.get(H_TIME, "")).strip()
-        user_id = str(row.get(H_USER_ID, "")).strip()
+    ok, fail = await notify_users([
+        (
+            user_id,
+            f"❌ Ваша запись на {date_str} в {t} отменена организатором.\n\n"
+            "Чтобы записаться снова: /start",
+            None,
+        )
+        for user_id, t in cancelled
+    ])
+    await message.answer(
+        f"✅ Отменено: {len(cancelled)}\n"
+        f"Уведомлено: {ok}, не доставлено: {fail}"
+    )
 
-        # только наши даты/слоты
-        if d not in SLOTS or t not in SLOTS[d]:
-            continue
 
-        reminder_sent = str(row.get(H_REMINDER_SENT, "")).strip()
-        if reminder_sent and not force:
-            continue
+@dp.message(Command("bulk_status"))
+async def bulk_status_command(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("Эта команда доступна только администратору.")
+        return
 
-        # Переводим в "ждёт подтверждения", слот всё равно занят
-        try:
-            sheet.update_cell(idx, COL_STATUS, STATUS_PENDING)
-        except Exception:
-            pass
+    try:
+        ev, date_str, time_range, rest = parse_bulk_args(message.text)
+        if len(rest) != 1 or rest[0] not in BULK_STATUS_ALIASES:
+            raise ValueError("неверный статус")
+    except ValueError:
+        await message.answer(BULK_USAGE)
+        return
+    new_status = BULK_STATUS_ALIASES[rest[0]]
 
-        text = (
-            "🔔 Напоминание о записи!\n\n"
-            f"📅 Дата: {d}\n"
-            f"🕗 Время: {t}\n\n"
-            "Пожалуйста, подтвердите, что вы придёте:\n"
-            "✅ Подтверждаю — всё ок\n"
-            "❌ Отменить — освободим слот для других"
-        )
+    try:
+        async with ev.rows_lock:
+            changed, unchanged = await run_blocking(bulk_set_status, ev, date_str, time_range, new_status)
+    except Exception as e:
+        print(f"[bulk_status] error: {e}")
+        await message.answer("❌ Ошибка при смене статуса. Таблица не изменена.")
+        return
 
-        try:
-            await bot.send_message(chat_id=int(user_id), text=text, reply_markup=reminder_keyboard(idx))
-            # пишем дату/время отправки (обновим всегда при force)
-            sheet.update_cell(idx, COL_REMINDER_SENT, now.strftime("%Y-%m-%d %H:%M:%S"))
-            sent_ok += 1
-        except Exception as e:
-            print(f"[reminder send] to {user_id} row {idx} failed: {e}")
-            sent_fail += 1
+    # Оба статуса занимают слот — меняется только статус, не занятость.
+    for t in changed:
+        ev.availability.update_booking(date_str, t, status=new_status)
 
-    return sent_ok, sent_fail
+    await message.answer(
+        f"✅ Статус «{new_status}» установлен: {len(changed)}\n"
+        f"Уже были в этом статусе: {unchanged}"
+    )
 
 
-@dp.callback_query(lambda c: c.data == "admin_send_reminders_confirm")
-async def admin_send_reminders_confirm(callback: types.CallbackQuery):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Недостаточно прав.", show_alert=True)
+@dp.message(Command("partition_migrate"))
+async def partition_migrate_command(message: types.Message):
+    """Разовый перенос записей из старого общего листа по листам дней."""
+    if not is_admin(message.from_user.id):
+        await message.answer("Эта команда доступна только администратору.")
         return
 
-    await callback.message.edit_text("⏳ Рассылаю напоминания…")
+    try:
+        ev, _ = pop_event_arg((message.text or "").split()[1:])
+    except ValueError:
+        await message.answer(f"Мероприятие не найдено. Есть: {', '.join(EVENTS)}")
+        return
 
+    await message.answer("⏳ Переношу записи из общего листа по дням…")
     try:
-        ok, fail = await send_reminders_now(force=True)
-        await callback.message.edit_text(
-            f"✅ Готово!\n\nОтправлено: {ok}\nНе доставлено: {fail}\n\n"
-            "Если нужно — можно нажать /admin и разослать ещё раз."
-        )
+        async with ev.rows_lock:
+            migrated, skipped = await run_blocking(migrate_sheet1_to_partitions, ev)
     except Exception as e:
-        print(f"[admin_send_reminders_confirm] error: {e}")
-        await callback.message.edit_text("❌ Ошибка при рассылке. Посмотрите логи Render.")
+        print(f"[partition_migrate] error: {e}")
+        await message.answer("❌ Ошибка при переносе. Общий лист не изменён.")
+        return
+
+    await ev.availability.refresh()
+    await message.answer(
+        f"✅ Перенесено: {migrated}\n"
+        f"Оставлено в общем листе (нет корректной даты): {skipped}"
+    )
 
 
 # =========================
 # USER FLOW
 # =========================
 @dp.message(Command("start"))
-async def send_welcome(message: types.Message, state: FSMContext):
+async def send_welcome(message: types.Message, state: FSMContext, command: CommandObject):
+    """/start [ключ мероприятия] — ключ приходит из ссылки t.me/<бот>?start=<ключ>."""
     await state.clear()
-    load_bookings_from_sheet()
 
     user_id = str(message.from_user.id)
+    key = (command.args or "").strip()
+    if key:
+        if key not in EVENTS:
+            await message.answer("❌ Мероприятие по этой ссылке не найдено. Проверьте ссылку у организатора.")
+            return
+        remember_user_event(user_id, key)
+    ev = event_for_user(user_id)
+    await ev.availability.ensure_fresh()
+
     row_index, row = None, None
     try:
-        row_index, row = find_user_active_booking(user_id)
+        _, row_index, row = await run_blocking(find_user_active_booking, ev, user_id)
     except Exception as e:
         print(f"[send_welcome] error: {e}")
 
@@ -486,27 +2049,28 @@ async def send_welcome(message: types.Message, state: FSMContext):
             f"🕗 Время: {time_str}\n"
             f"📌 Статус: {status}{extra}\n\n"
             "Вы можете изменить время или отменить запись:",
-            reply_markup=manage_keyboard()
+            reply_markup=manage_keyboard(ev)
         )
         return
 
-    await message.answer(EVENT_INFO, reply_markup=days_keyboard())
+    await message.answer(ev.info, reply_markup=days_keyboard(ev))
 
 
 @dp.callback_query(lambda c: c.data.startswith("day_"))
 async def choose_time(callback: types.CallbackQuery, state: FSMContext):
-    date_str = callback.data.split("_", 1)[1]
-    if date_str not in SLOTS:
+    ev, parts = parse_event_callback(callback.data, "day_")
+    date_str = parts[0] if len(parts) == 1 else ""
+    if date_str not in ev.slots:
         await callback.answer("Неверная дата", show_alert=True)
         return
 
     user_id = str(callback.from_user.id)
     data = await state.get_data()
-    mode = data.get("mode")  # "change" или None
+    mode = data.get("mode") if data.get("event") == ev.key else None  # "change" или None
 
     if mode != "change":
         try:
-            row_index, row = find_user_active_booking(user_id)
+            _, row_index, row = await run_blocking(find_user_active_booking, ev, user_id)
             if row_index and row:
                 await callback.answer("У вас уже есть активная запись.", show_alert=True)
                 await callback.message.edit_text(
@@ -515,74 +2079,118 @@ async def choose_time(callback: types.CallbackQuery, state: FSMContext):
                     f"🕗 Время: {row.get(H_TIME)}\n"
                     f"📌 Статус: {row.get(H_STATUS)}\n\n"
                     "Вы можете изменить время или отменить запись:",
-                    reply_markup=manage_keyboard()
+                    reply_markup=manage_keyboard(ev)
                 )
                 return
         except Exception as e:
             print(f"[choose_time] limit check error: {e}")
 
-    load_bookings_from_sheet()
-    free_slots = [t for t, booked in SLOTS[date_str].items() if not booked]
+    if not await ev.availability.ensure_fresh():
+        await callback.answer(STALE_TEXT, show_alert=True)
+        return
+    free_slots = [t for t, booked in ev.slots[date_str].items() if not booked]
     if not free_slots:
         await callback.message.edit_text("❌ Все слоты на этот день заняты.")
         return
 
-    buttons = [[InlineKeyboardButton(text=t, callback_data=f"slot_{date_str}_{t}")] for t in free_slots[:40]]
+    buttons = [[InlineKeyboardButton(text=t, callback_data=f"slot_{ev.key}_{date_str}_{t}")] for t in free_slots[:40]]
     keyboard = InlineKeyboardMarkup(
-        inline_keyboard=buttons + [[InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_days")]]
+        inline_keyboard=buttons + [[InlineKeyboardButton(text="⬅️ Назад", callback_data=f"back_to_days_{ev.key}")]]
     )
     await callback.message.edit_text(f"Выберите время на {date_str}:", reply_markup=keyboard)
 
 
-@dp.callback_query(lambda c: c.data == "back_to_days")
+@dp.callback_query(lambda c: c.data.startswith("back_to_days"))
 async def back_to_days(callback: types.CallbackQuery, state: FSMContext):
+    ev, _ = parse_event_callback(callback.data, "back_to_days")
     data = await state.get_data()
-    if data.get("mode") == "change":
-        await callback.message.edit_text("Выберите новый день:", reply_markup=days_keyboard())
+    if data.get("mode") == "change" and data.get("event") == ev.key:
+        await callback.message.edit_text("Выберите новый день:", reply_markup=days_keyboard(ev))
+    else:
+        await callback.message.edit_text(ev.info, reply_markup=days_keyboard(ev))
+
+
+def rebook_row(ev, partition: str, sheet_row: int, user_id: str, date_str: str, time_str: str) -> str:
+    """
+    Переносит запись пользователя на новый слот одним batchUpdate:
+    тот же день — правка ячеек; другой день — appendCells в новый лист
+    и удаление старой строки. Проверки делаются по тому же чтению, что и запись,
+    поэтому вызывать только под ev.rows_lock.
+    Возвращает "ok", "taken" (слот занят) или "changed" (строка уже не его).
+    """
+    partitions = read_partitions(ev, list(ev.partitions))
+    if _slot_taken(partitions, date_str, time_str):
+        return "taken"
+
+    records = partitions.get(partition, [])
+    if not 2 <= sheet_row < len(records) + 2:
+        return "changed"
+    row = records[sheet_row - 2]
+    if str(row.get(H_USER_ID, "")).strip() != user_id or str(row.get(H_STATUS, "")).strip() not in OCCUPYING_STATUSES:
+        return "changed"
+
+    sheet = ev.partitions[partition]
+    if partition == date_str:
+        requests = [
+            update_cell_request(sheet.id, sheet_row, col, value)
+            for col, value in ((COL_DATE, date_str), (COL_TIME, time_str), (COL_STATUS, STATUS_BOOKED))
+        ]
     else:
-        await callback.message.edit_text(EVENT_INFO, reply_markup=days_keyboard())
+        row_vals = [str(row.get(h, "")) for h in HEADERS_RU]
+        row_vals[COL_DATE - 1] = date_str
+        row_vals[COL_TIME - 1] = time_str
+        row_vals[COL_STATUS - 1] = STATUS_BOOKED
+        target = get_partition(ev, date_str)
+        requests = [append_rows_request(target.id, [row_vals])] + delete_rows_requests(sheet.id, [sheet_row])
+    batch_update_sheet(ev, requests)
+    return "ok"
 
 
 @dp.callback_query(lambda c: c.data.startswith("slot_"))
 async def start_booking(callback: types.CallbackQuery, state: FSMContext):
-    parts = callback.data.split("_")
-    if len(parts) != 3:
+    ev, parts = parse_event_callback(callback.data, "slot_")
+    if len(parts) != 2:
         await callback.answer("Ошибка", show_alert=True)
         return
 
-    date_str, time_str = parts[1], parts[2]
-    if date_str not in SLOTS or time_str not in SLOTS[date_str]:
+    date_str, time_str = parts
+    if date_str not in ev.slots or time_str not in ev.slots[date_str]:
         await callback.answer("Слот не найден", show_alert=True)
         return
 
     user_id = str(callback.from_user.id)
     data = await state.get_data()
-    mode = data.get("mode")
+    mode = data.get("mode") if data.get("event") == ev.key else None
 
-    load_bookings_from_sheet()
-    if SLOTS[date_str][time_str]:
+    if not await ev.availability.ensure_fresh():
+        await callback.answer(STALE_TEXT, show_alert=True)
+        return
+    if ev.slots[date_str][time_str]:
         await callback.answer("Слот уже занят!", show_alert=True)
         return
 
     # === СМЕНА ВРЕМЕНИ (без повторного ввода) ===
     if mode == "change":
         try:
+            partition = str(data["partition"])
             sheet_row = int(data["sheet_row"])
             old_date = str(data["old_date"])
             old_time = str(data["old_time"])
 
-            if slot_is_occupied_in_sheet(date_str, time_str):
+            async with ev.rows_lock:
+                result = await run_blocking(rebook_row, ev, partition, sheet_row, user_id, date_str, time_str)
+            if result == "taken":
+                ev.availability.set(date_str, time_str, True)
                 await callback.answer("Этот слот только что заняли. Выберите другой.", show_alert=True)
                 return
+            if result == "changed":
+                await state.clear()
+                await callback.answer("Запись изменилась в таблице. Начните заново: /start", show_alert=True)
+                return
 
-            sheet = get_sheet_gspread()
-            sheet.update_cell(sheet_row, COL_DATE, date_str)
-            sheet.update_cell(sheet_row, COL_TIME, time_str)
-            sheet.update_cell(sheet_row, COL_STATUS, STATUS_BOOKED)
-
-            if old_date in SLOTS and old_time in SLOTS[old_date]:
-                SLOTS[old_date][old_time] = False
-            SLOTS[date_str][time_str] = True
+            ev.availability.set(old_date, old_time, False)
+            ev.availability.set(date_str, time_str, True)
+            ev.availability.set_user(user_id, date_str)
 
             await state.clear()
             await callback.message.edit_text(
@@ -590,7 +2198,7 @@ async def start_booking(callback: types.CallbackQuery, state: FSMContext):
                 f"📅 Дата: {date_str}\n"
                 f"🕗 Время: {time_str}\n"
                 f"📌 Статус: {STATUS_BOOKED}",
-                reply_markup=manage_keyboard()
+                reply_markup=manage_keyboard(ev)
             )
             return
 
@@ -601,7 +2209,7 @@ async def start_booking(callback: types.CallbackQuery, state: FSMContext):
 
     # === НОВАЯ ЗАПИСЬ: 1 аккаунт = 1 слот ===
     try:
-        row_index, row = find_user_active_booking(user_id)
+        _, row_index, row = await run_blocking(find_user_active_booking, ev, user_id)
         if row_index and row:
             await callback.answer("У вас уже есть активная запись.", show_alert=True)
             await callback.message.edit_text(
@@ -610,14 +2218,14 @@ async def start_booking(callback: types.CallbackQuery, state: FSMContext):
                 f"🕗 Время: {row.get(H_TIME)}\n"
                 f"📌 Статус: {row.get(H_STATUS)}\n\n"
                 "Вы можете изменить время или отменить запись:",
-                reply_markup=manage_keyboard()
+                reply_markup=manage_keyboard(ev)
             )
             await state.clear()
             return
     except Exception as e:
         print(f"[start_booking] limit check error: {e}")
 
-    await state.update_data(date=date_str, time=time_str)
+    await state.update_data(event=ev.key, date=date_str, time=time_str)
     await state.set_state(BookingStates.waiting_for_name)
     await callback.message.edit_text("Введите ваше имя:")
 
@@ -633,6 +2241,24 @@ async def get_name(message: types.Message, state: FSMContext):
     await message.answer("Введите ваш телефон (только цифры, например: 79991234567):")
 
 
+def commit_new_booking(ev, user_id: str, name: str, phone: str, date_str: str, time_str: str):
+    """
+    Финальная проверка «1 аккаунт = 1 слот» и занятости слота по одному чтению
+    всех партиций, затем append_row. Вызывать только под ev.rows_lock —
+    иначе между проверкой и записью может вклиниться другая запись.
+    Возвращает ("exists", запись), ("taken", None) или ("ok", None).
+    """
+    partitions = read_partitions(ev, list(ev.partitions))
+    _, row_index, row = _find_active_row(partitions, user_id)
+    if row_index:
+        return "exists", row
+    if _slot_taken(partitions, date_str, time_str):
+        return "taken", None
+    sheet = get_partition(ev, date_str)
+    sheet.append_row([user_id, name, phone, date_str, time_str, STATUS_BOOKED, "", ""])
+    return "ok", None
+
+
 @dp.message(BookingStates.waiting_for_phone)
 async def get_phone(message: types.Message, state: FSMContext):
     phone = (message.text or "").strip()
@@ -641,52 +2267,51 @@ async def get_phone(message: types.Message, state: FSMContext):
         return
 
     user_id = str(message.from_user.id)
-
-    # супер-строго: 1 аккаунт = 1 слот
-    try:
-        row_index, row = find_user_active_booking(user_id)
-        if row_index and row:
-            await message.answer(
-                "✅ У вас уже есть активная запись.\n\n"
-                f"📅 Дата: {row.get(H_DATE)}\n"
-                f"🕗 Время: {row.get(H_TIME)}\n"
-                f"📌 Статус: {row.get(H_STATUS)}\n\n"
-                "Вы можете изменить время или отменить запись:",
-                reply_markup=manage_keyboard()
-            )
-            await state.clear()
-            return
-    except Exception as e:
-        print(f"[get_phone] limit check error: {e}")
-        await message.answer("Ошибка проверки записей. Попробуйте позже.")
-        return
-
     data = await state.get_data()
+    ev = EVENTS.get(data.get("event")) or EVENTS[DEFAULT_EVENT_KEY]
+
     date_str = data["date"]
     time_str = data["time"]
     name = data["name"]
 
-    load_bookings_from_sheet()
-    if SLOTS.get(date_str, {}).get(time_str) is None or SLOTS[date_str][time_str]:
-        await message.answer("❌ Увы, этот слот только что заняли. Выберите другое время: /start")
-        await state.clear()
+    if not await ev.availability.ensure_fresh():
+        await message.answer(STALE_TEXT)
         return
-
-    if slot_is_occupied_in_sheet(date_str, time_str):
-        SLOTS[date_str][time_str] = True
+    if ev.slots.get(date_str, {}).get(time_str) is None or ev.slots[date_str][time_str]:
         await message.answer("❌ Увы, этот слот только что заняли. Выберите другое время: /start")
         await state.clear()
         return
 
+    # Финальная проверка и запись — одним блокирующим вызовом под замком мероприятия.
     try:
-        sheet = get_sheet_gspread()
-        sheet.append_row([user_id, name, phone, date_str, time_str, STATUS_BOOKED, "", ""])
-        SLOTS[date_str][time_str] = True
+        async with ev.rows_lock:
+            result, row = await run_blocking(commit_new_booking, ev, user_id, name, phone, date_str, time_str)
     except Exception as e:
-        print(f"[append_row] error: {e}")
+        print(f"[commit_booking] error: {e}")
         await message.answer("Произошла ошибка при записи. Попробуйте позже.")
         return
 
+    if result == "exists":
+        ev.availability.set_user(user_id, str(row.get(H_DATE, "")).strip())
+        await message.answer(
+            "✅ У вас уже есть активная запись.\n\n"
+            f"📅 Дата: {row.get(H_DATE)}\n"
+            f"🕗 Время: {row.get(H_TIME)}\n"
+            f"📌 Статус: {row.get(H_STATUS)}\n\n"
+            "Вы можете изменить время или отменить запись:",
+            reply_markup=manage_keyboard(ev)
+        )
+        await state.clear()
+        return
+    if result == "taken":
+        ev.availability.set(date_str, time_str, True)
+        await message.answer("❌ Увы, этот слот только что заняли. Выберите другое время: /start")
+        await state.clear()
+        return
+
+    ev.availability.set(date_str, time_str, True)
+    ev.availability.set_user(user_id, date_str)
+
     await message.answer(
         "✅ Вы записаны!\n\n"
         f"📅 Дата: {date_str}\n"
@@ -694,7 +2319,7 @@ async def get_phone(message: types.Message, state: FSMContext):
         f"👤 Имя: {name}\n"
         f"📞 Телефон: {phone}\n"
         f"📌 Статус: {STATUS_BOOKED}",
-        reply_markup=manage_keyboard()
+        reply_markup=manage_keyboard(ev)
     )
     await state.clear()
 
@@ -702,23 +2327,25 @@ async def get_phone(message: types.Message, state: FSMContext):
 # =========================
 # MANAGE BUTTONS
 # =========================
-@dp.callback_query(lambda c: c.data == "cancel_booking")
+@dp.callback_query(lambda c: c.data.startswith("cancel_booking"))
 async def cancel_booking(callback: types.CallbackQuery, state: FSMContext):
+    ev, _ = parse_event_callback(callback.data, "cancel_booking")
     user_id = str(callback.from_user.id)
     try:
-        sheet = get_sheet_gspread()
-        row_index, row = find_user_active_booking(user_id)
-        if not row_index:
-            await callback.answer("У вас нет активной записи.", show_alert=True)
-            return
+        async with ev.rows_lock:
+            partition, row_index, row = await run_blocking(find_user_active_booking, ev, user_id)
+            if not row_index:
+                await callback.answer("У вас нет активной записи.", show_alert=True)
+                return
 
-        date_str = str(row.get(H_DATE))
-        time_str = str(row.get(H_TIME))
+            date_str = str(row.get(H_DATE))
+            time_str = str(row.get(H_TIME))
 
-        sheet.delete_rows(row_index)
+            sheet = await run_blocking(get_partition, ev, partition)
+            await run_blocking(sheet.delete_rows, row_index)
 
-        if date_str in SLOTS and time_str in SLOTS[date_str]:
-            SLOTS[date_str][time_str] = False
+        ev.availability.set(date_str, time_str, False)
+        ev.availability.set_user(user_id, None)
 
     except Exception as e:
         print(f"[cancel_booking] error: {e}")
@@ -729,11 +2356,12 @@ async def cancel_booking(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_text("✅ Запись отменена и удалена.\n\nЧтобы записаться снова: /start")
 
 
-@dp.callback_query(lambda c: c.data == "change_booking")
+@dp.callback_query(lambda c: c.data.startswith("change_booking"))
 async def change_booking(callback: types.CallbackQuery, state: FSMContext):
+    ev, _ = parse_event_callback(callback.data, "change_booking")
     user_id = str(callback.from_user.id)
     try:
-        row_index, row = find_user_active_booking(user_id)
+        partition, row_index, row = await run_blocking(find_user_active_booking, ev, user_id)
         if not row_index:
             await callback.answer("У вас нет активной записи.", show_alert=True)
             return
@@ -741,38 +2369,75 @@ async def change_booking(callback: types.CallbackQuery, state: FSMContext):
         old_date = str(row.get(H_DATE))
         old_time = str(row.get(H_TIME))
 
-        await state.update_data(mode="change", sheet_row=row_index, old_date=old_date, old_time=old_time)
+        await state.update_data(
+            mode="change", event=ev.key, partition=partition, sheet_row=row_index, old_date=old_date, old_time=old_time
+        )
 
     except Exception as e:
         print(f"[change_booking] error: {e}")
         await callback.answer("Ошибка. Попробуйте позже.", show_alert=True)
         return
 
-    load_bookings_from_sheet()
-    await callback.message.edit_text("Выберите новый день:", reply_markup=days_keyboard())
+    await ev.availability.ensure_fresh()
+    await callback.message.edit_text("Выберите новый день:", reply_markup=days_keyboard(ev))
 
 
 # =========================
 # REMINDER CONFIRM / CANCEL
 # =========================
+def parse_reminder_callback(data: str) -> tuple[Event, str | None, int]:
+    """
+    'rem_yes_spring_2026-02-12_5' -> (EVENTS['spring'], '2026-02-12', 5).
+    Кнопки до разбиения по дням ('rem_yes_5') -> (мероприятие по умолчанию, None, 5).
+    """
+    prefix = "rem_yes_" if data.startswith("rem_yes_") else "rem_cancel_"
+    ev, parts = parse_event_callback(data, prefix)
+    if len(parts) == 1:
+        return ev, None, int(parts[0])
+    if len(parts) != 2 or not is_partition_title(parts[0]):
+        raise ValueError(f"unexpected reminder callback: {data}")
+    return ev, parts[0], int(parts[1])
+
+
+def locate_reminder_row(ev, partition, row_index: int, user_id: str):
+    """
+    (лист, номер строки, значения строки) для кнопки напоминания.
+    partition=None — старая кнопка на первый (общий) лист; если строку оттуда
+    уже перенесли по дням, берётся активная запись пользователя. Так же и
+    для листа дня, которого нет в каталоге (заархивирован): заново не создаётся.
+    """
+    sheet = ev.partitions.get(partition) if partition else get_sheet_gspread(ev)
+    row_vals = sheet.row_values(row_index) if sheet is not None else []
+    if sheet is None or partition is None and (len(row_vals) < COL_USER_ID or str(row_vals[COL_USER_ID - 1]).strip() != user_id):
+        found, found_index, row = find_user_active_booking(ev, user_id)
+        if not found_index:
+            return sheet, row_index, []
+        return ev.partitions[found], found_index, [str(row.get(h, "")) for h in HEADERS_RU]
+    return sheet, row_index, row_vals
+
+
 @dp.callback_query(lambda c: c.data.startswith("rem_yes_"))
 async def reminder_yes(callback: types.CallbackQuery):
     try:
-        row_index = int(callback.data.split("_")[-1])
-        sheet = get_sheet_gspread()
+        ev, partition, row_index = parse_reminder_callback(callback.data)
 
         user_id = str(callback.from_user.id)
-        row_vals = sheet.row_values(row_index)
-        if not row_vals or len(row_vals) < 6:
-            await callback.answer("Запись не найдена.", show_alert=True)
-            return
+        async with ev.rows_lock:
+            sheet, row_index, row_vals = await run_blocking(locate_reminder_row, ev, partition, row_index, user_id)
+            if not row_vals or len(row_vals) < 6:
+                await callback.answer("Запись не найдена.", show_alert=True)
+                return
 
-        if str(row_vals[COL_USER_ID - 1]).strip() != user_id:
-            await callback.answer("Это не ваша запись.", show_alert=True)
-            return
+            if str(row_vals[COL_USER_ID - 1]).strip() != user_id:
+                await callback.answer("Это не ваша запись.", show_alert=True)
+                return
 
-        sheet.update_cell(row_index, COL_STATUS, STATUS_BOOKED)
-        sheet.update_cell(row_index, COL_ATTENDANCE_CONFIRMED, "Подтверждено ✅")
+            await run_blocking(sheet.update_cell, row_index, COL_STATUS, STATUS_BOOKED)
+            await run_blocking(sheet.update_cell, row_index, COL_ATTENDANCE_CONFIRMED, "Подтверждено ✅")
+        ev.availability.update_booking(
+            str(row_vals[COL_DATE - 1]).strip(), str(row_vals[COL_TIME - 1]).strip(),
+            status=STATUS_BOOKED, confirmed=True,
+        )
 
         await callback.message.edit_text("✅ Отлично! Мы вас ждём. До встречи на мероприятии 🙂")
 
@@ -784,26 +2449,26 @@ async def reminder_yes(callback: types.CallbackQuery):
 @dp.callback_query(lambda c: c.data.startswith("rem_cancel_"))
 async def reminder_cancel(callback: types.CallbackQuery):
     try:
-        row_index = int(callback.data.split("_")[-1])
-        sheet = get_sheet_gspread()
+        ev, partition, row_index = parse_reminder_callback(callback.data)
 
         user_id = str(callback.from_user.id)
-        row_vals = sheet.row_values(row_index)
-        if not row_vals or len(row_vals) < 6:
-            await callback.answer("Запись не найдена.", show_alert=True)
-            return
+        async with ev.rows_lock:
+            sheet, row_index, row_vals = await run_blocking(locate_reminder_row, ev, partition, row_index, user_id)
+            if not row_vals or len(row_vals) < 6:
+                await callback.answer("Запись не найдена.", show_alert=True)
+                return
 
-        if str(row_vals[COL_USER_ID - 1]).strip() != user_id:
-            await callback.answer("Это не ваша запись.", show_alert=True)
-            return
+            if str(row_vals[COL_USER_ID - 1]).strip() != user_id:
+                await callback.answer("Это не ваша запись.", show_alert=True)
+                return
 
-        date_str = str(row_vals[COL_DATE - 1]).strip()
-        time_str = str(row_vals[COL_TIME - 1]).strip()
+            date_str = str(row_vals[COL_DATE - 1]).strip()
+            time_str = str(row_vals[COL_TIME - 1]).strip()
 
-        sheet.delete_rows(row_index)
+            await run_blocking(sheet.delete_rows, row_index)
 
-        if date_str in SLOTS and time_str in SLOTS[date_str]:
-            SLOTS[date_str][time_str] = False
+        ev.availability.set(date_str, time_str, False)
+        ev.availability.set_user(user_id, None)
 
         await callback.message.edit_text("✅ Запись отменена и удалена.\n\nЕсли передумаете — можно записаться снова: /start")
 
@@ -817,23 +2482,24 @@ async def reminder_cancel(callback: types.CallbackQuery):
 # =========================
 async def send_reminders_if_needed():
     """
-    10 февраля (по Берлину) — best-effort. На бесплатном Render может не сработать,
-    если сервис спит. Для надёжности используйте /admin.
+    В день напоминания каждого мероприятия (по Берлину) — best-effort. На бесплатном
+    Render может не сработать, если сервис спит. Для надёжности используйте /admin.
     """
-    try:
-        now = datetime.now(TZ)
-        if now.date() != REMINDER_DAY:
-            return
-        if now.time() < REMINDER_TIME_LOCAL:
-            return
+    now = datetime.now(TZ)
+    for ev in EVENTS.values():
+        try:
+            if now.date() != ev.reminder_day:
+                continue
+            if now.time() < ev.reminder_time:
+                continue
 
-        # только тем, кому ещё не отправляли
-        ok, fail = await send_reminders_now(force=False)
-        if ok or fail:
-            print(f"[auto reminders] ok={ok} fail={fail}")
+            # только тем, кому ещё не отправляли
+            ok, fail = await send_reminders_now(ev, force=False)
+            if ok or fail:
+                print(f"[auto reminders] {ev.key} ok={ok} fail={fail}")
 
-    except Exception as e:
-        print(f"[send_reminders_if_needed] error: {e}")
+        except Exception as e:
+            print(f"[send_reminders_if_needed] {ev.key} error: {e}")
 
 
 async def reminder_loop():
@@ -842,27 +2508,482 @@ async def reminder_loop():
         await asyncio.sleep(600)
 
 
+# =========================
+# ARCHIVE LOOP
+# =========================
+async def archive_loop():
+    events = [ev for ev in EVENTS.values() if ev.archive_sheet_id]
+    if not events:
+        print("[archive] архивные таблицы не заданы — прошедшие дни не архивируются.")
+        return
+
+    while True:
+        for ev in events:
+            try:
+                # удаление листов сдвигает партиции — не посреди чужих правок по номерам строк
+                async with ev.rows_lock:
+                    archived = await run_blocking(archive_finished_days, ev)
+                if archived:
+                    print(f"[archive] {ev.key} archived: {', '.join(archived)}")
+                    await ev.availability.refresh()
+            except Exception as e:
+                print(f"[archive_loop] {ev.key} error: {e}")
+        await asyncio.sleep(ARCHIVE_CHECK_INTERVAL)
+
+
+# =========================
+# RECONCILIATION
+# =========================
+# Периодическая сверка таблицы с памятью: одно чтение только нужных колонок
+# всех партиций, один проход с хешированием (O(n)), по желанию — исправление
+# одним spreadsheets.batchUpdate. Итоговый снимок заменяет кэш мероприятия.
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "900"))  # сек, 0 — выключено
+RECONCILE_AUTOFIX = os.getenv("RECONCILE_AUTOFIX", "0") == "1"
+RECONCILE_PENDING_TTL_H = float(os.getenv("RECONCILE_PENDING_TTL_H", "48"))  # ч после напоминания
+
+# Колонки D:H; ID пользователя (A) читается отдельным диапазоном, имя и телефон — нет.
+RECONCILE_COLUMNS = HEADERS_RU[COL_DATE - 1:]
+
+# Исправляются удалением строки (по решению админа или RECONCILE_AUTOFIX).
+RECONCILE_FIXABLE = ("slot_conflict", "duplicate_user", "stale_pending")
+# Только в отчёт: правильное действие решает человек.
+RECONCILE_REPORT_ONLY = ("out_of_range", "misrouted", "missing_user_id")
+
+RECONCILE_TITLES = {
+    "slot_conflict": "Две записи на один слот",
+    "duplicate_user": "Повторная запись пользователя",
+    "stale_pending": f"Не подтверждены дольше {RECONCILE_PENDING_TTL_H:g} ч после напоминания",
+    "out_of_range": "Дата/время вне сетки мероприятия",
+    "misrouted": "Запись не в листе своего дня",
+    "missing_user_id": "Без ID пользователя (внесены вручную?)",
+}
+
+
+def read_projected_partitions(ev) -> dict[str, list[dict]]:
+    """
+    Одно чтение (values.batchGet) колонок A и D:H всех партиций мероприятия:
+    дата -> записи в порядке строк, первая запись — строка 2.
+    """
+    dates = list(ev.partitions)
+    if not dates:
+        return {}
+    ev.availability.take_read()
+    ranges = [r for d in dates for r in (f"'{d}'!A2:A", f"'{d}'!D2:H")]
+    value_ranges = get_spreadsheet(ev).values_batch_get(ranges).get("valueRanges", [])
+
+    result = {}
+    for i, d in enumerate(dates):
+        ids = value_ranges[2 * i].get("values", [])
+        rest = value_ranges[2 * i + 1].get("values", [])
+        records = []
+        for n in range(max(len(ids), len(rest))):
+            row = dict(zip(RECONCILE_COLUMNS, rest[n] if n < len(rest) else []))
+            row[H_USER_ID] = ids[n][0] if n < len(ids) and ids[n] else ""
+            records.append(row)
+        result[d] = records
+    return result
+
+
+def parse_sheet_time(value: str):
+    """'2026-02-10 10:00:05' (как пишет рассылка напоминаний) -> datetime по Берлину."""
+    try:
+        return datetime.strptime(str(value).strip(), "%Y-%m-%d %H:%M:%S").replace(tzinfo=TZ)
+    except ValueError:
+        return None
+
+
+def reconcile_event(ev, autofix: bool):
+    """
+    Находит расхождения в таблице мероприятия и (autofix) удаляет лишние строки.
+    Возвращает (отчёт, снимок для AvailabilityCache.apply).
+
+    Из двух записей на слот / двух записей пользователя остаётся первая
+    по порядку листов и строк — та, что была сделана раньше.
+    """
+    report = {key: [] for key in RECONCILE_FIXABLE + RECONCILE_REPORT_ONLY}
+    occupied, directory = {}, {}
+    seen_slots, seen_users = set(), set()
+    to_delete = {}  # партиция -> [номер строки]
+    stale_before = datetime.now(TZ) - timedelta(hours=RECONCILE_PENDING_TTL_H)
+    active = 0
+
+    for partition, records in read_projected_partitions(ev).items():
+        for idx, row in enumerate(records, start=2):
+            status = str(row.get(H_STATUS, "")).strip()
+            if status not in OCCUPYING_STATUSES:
+                continue
+            active += 1
+            uid = str(row.get(H_USER_ID, "")).strip()
+            d = str(row.get(H_DATE, "")).strip()
+            t = str(row.get(H_TIME, "")).strip()
+            item = (partition, idx, uid, d, t)
+            in_grid = d in ev.slots and t in ev.slots[d]
+
+            if not in_grid:
+                report["out_of_range"].append(item)
+            if d != partition:
+                report["misrouted"].append(item)
+            if not uid:
+                # Ручная запись без ID — не «повтор пользователя» и не в каталог.
+                report["missing_user_id"].append(item)
+
+            sent_at = parse_sheet_time(row.get(H_REMINDER_SENT, ""))
+            if status == STATUS_PENDING and sent_at and sent_at < stale_before:
+                issue = "stale_pending"
+            elif in_grid and (d, t) in seen_slots:
+                issue = "slot_conflict"
+            elif uid and uid in seen_users:
+                issue = "duplicate_user"
+            else:
+                issue = None
+
+            if issue:
+                report[issue].append(item)
+                if autofix:
+                    to_delete.setdefault(partition, []).append(idx)
+                    continue
+
+            if uid:
+                seen_users.add(uid)
+                directory[uid] = partition
+            if in_grid:
+                seen_slots.add((d, t))
+                occupied[(d, t)] = booking_info(row)
+
+    requests = []
+    for partition, row_indexes in to_delete.items():
+        requests += delete_rows_requests(ev.partitions[partition].id, row_indexes)
+    batch_update_sheet(ev, requests)
+
+    report["active"] = active
+    report["fixed"] = sum(len(v) for v in to_delete.values())
+    return report, (occupied, directory)
+
+
+async def reconcile(ev, autofix: bool) -> dict:
+    """
+    Сверка через кэш: чтение встаёт в single-flight вместо обычного обновления,
+    так что локальные изменения во время сверки не теряются.
+    """
+    result = {}
+
+    def loader():
+        result["report"], snapshot = reconcile_event(ev, autofix)
+        return snapshot
+
+    # Удаления по номерам строк — под тем же замком, что и хендлеры.
+    async with ev.rows_lock:
+        await ev.availability.refresh(loader)
+    if "report" not in result:
+        raise RuntimeError(f"reconcile {ev.key}: чтение/запись таблицы не удались")
+    report = result["report"]
+    report["cache"] = ev.availability.last_drift
+
+    if report["fixed"]:
+        await notify_users([
+            (
+                uid,
+                f"❌ Ваша запись на {d} в {t} отменена: "
+                + ("не подтверждена после напоминания." if key == "stale_pending" else "слот оказался занят дважды.")
+                + "\n\nЧтобы записаться снова: /start",
+                None,
+            )
+            for key in ("stale_pending", "slot_conflict")
+            for _, _, uid, d, t in report[key]
+            if uid
+        ])
+    return report
+
+
+def format_reconcile_report(ev, report: dict, limit: int = 5) -> str:
+    drift = report["cache"] or {}
+    lines = [
+        f"🧮 Сверка «{ev.key}»: активных записей {report['active']}",
+        f"Кэш: не было в памяти {drift.get('missing', 0)}, лишних {drift.get('phantom', 0)}, "
+        f"другой статус {drift.get('status', 0)}, каталог {drift.get('directory', 0)}",
+    ]
+    for key in RECONCILE_FIXABLE + RECONCILE_REPORT_ONLY:
+        items = report[key]
+        if not items:
+            continue
+        lines.append(f"\n{RECONCILE_TITLES[key]}: {len(items)}")
+        lines += [f"• {d} {t} — {uid or '?'} (лист {p}, строка {idx})" for p, idx, uid, d, t in items[:limit]]
+        if len(items) > limit:
+            lines.append(f"… и ещё {len(items) - limit}")
+    if report["fixed"]:
+        lines.append(f"\n✅ Удалено строк: {report['fixed']}")
+    elif any(report[key] for key in RECONCILE_FIXABLE):
+        lines.append("\nИсправить: /reconcile fix" + ("" if ev.key == DEFAULT_EVENT_KEY else f" @{ev.key}"))
+    return "\n".join(lines)
+
+
+def reconcile_has_issues(report: dict) -> bool:
+    return any(report[key] for key in RECONCILE_FIXABLE + RECONCILE_REPORT_ONLY)
+
+
+async def reconcile_loop():
+    if not RECONCILE_INTERVAL:
+        return
+
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL)
+        for ev in EVENTS.values():
+            try:
+                report = await reconcile(ev, RECONCILE_AUTOFIX)
+                if not reconcile_has_issues(report):
+                    continue
+                text = format_reconcile_report(ev, report)
+                print(f"[reconcile] {text}")
+                if ADMIN_USER_ID:
+                    await bot.send_message(chat_id=int(ADMIN_USER_ID), text=text)
+            except Exception as e:
+                print(f"[reconcile_loop] {ev.key} error: {e}")
+
+
+@dp.message(Command("reconcile"))
+async def reconcile_command(message: types.Message):
+    """/reconcile [fix] [@ключ] — сверить таблицу с памятью (fix — удалить конфликтующие строки)."""
+    if not is_admin(message.from_user.id):
+        await message.answer("Эта команда доступна только администратору.")
+        return
+
+    try:
+        ev, args = pop_event_arg((message.text or "").split()[1:])
+        if args not in ([], ["fix"]):
+            raise ValueError("неверные аргументы")
+    except ValueError:
+        await message.answer(f"Использование: /reconcile [fix] [@ключ]. Мероприятия: {', '.join(EVENTS)}")
+        return
+
+    await message.answer("⏳ Сверяю таблицу…")
+    try:
+        report = await reconcile(ev, autofix=bool(args))
+    except Exception as e:
+        print(f"[reconcile] error: {e}")
+        await message.answer("❌ Ошибка при сверке. Посмотрите логи Render.")
+        return
+
+    await message.answer(format_reconcile_report(ev, report))
+
+
+# =========================
+# ADMIN DASHBOARD (SSE)
+# =========================
+# Занятость, ожидающие подтверждения и статус напоминаний — только из памяти
+# процесса (кэш мероприятия), без обращений к Google API на каждого зрителя.
+# Мероприятие выбирается параметром ?event=<ключ> (по умолчанию — DEFAULT_EVENT).
+DASHBOARD_TOKEN = os.getenv("DASHBOARD_TOKEN")
+DASHBOARD_PATH = "/admin/dashboard"
+DASHBOARD_HEARTBEAT = 15  # сек
+
+
+def dashboard_authorized(request: web.Request) -> bool:
+    if not DASHBOARD_TOKEN:
+        return False
+    token = request.query.get("token", "")
+    auth = request.headers.get("Authorization", "")
+    if auth.startswith("Bearer "):
+        token = auth[len("Bearer "):]
+    return hmac.compare_digest(token.encode(), DASHBOARD_TOKEN.encode())
+
+
+def dashboard_event(request: web.Request) -> Event:
+    ev = EVENTS.get(request.query.get("event", DEFAULT_EVENT_KEY))
+    if ev is None:
+        raise web.HTTPNotFound(text="unknown event")
+    return ev
+
+
+def dashboard_state(ev: Event) -> str:
+    """JSON состояния; пересобирается один раз на версию, а не на каждого зрителя."""
+    cache = ev.availability
+    if ev.dashboard_cache["version"] == cache.version:
+        return ev.dashboard_cache["payload"]
+
+    days, pending = [], []
+    reminders = {"sent": 0, "not_sent": 0, "confirmed": 0}
+    for d, times in ev.slots.items():
+        slots = []
+        counts = {"free": 0, "booked": 0, "pending": 0}
+        for t in times:
+            info = cache.bookings.get((d, t))
+            if info is None:
+                state = "free"
+            elif info["status"] == STATUS_PENDING:
+                state = "pending"
+                pending.append({"date": d, "time": t})
+            else:
+                state = "booked"
+            counts[state] += 1
+            if info is not None:
+                reminders["sent" if info["reminder_sent"] else "not_sent"] += 1
+                reminders["confirmed"] += info["confirmed"]
+            slots.append({
+                "time": t,
+                "state": state,
+                "reminder_sent": bool(info and info["reminder_sent"]),
+                "confirmed": bool(info and info["confirmed"]),
+            })
+        days.append({"date": d, "label": ev.day_labels.get(d, d), "total": len(times), **counts, "slots": slots})
+
+    age = cache.age()
+    payload = json.dumps({
+        "event": ev.key,
+        "events": list(EVENTS),
+        "version": cache.version,
+        "generated_at": datetime.now(TZ).isoformat(timespec="seconds"),
+        "snapshot_age_s": None if age is None else round(age, 1),
+        "days": days,
+        "pending": pending,
+        "reminders": {
+            **reminders,
+            "day": ev.reminder_day.isoformat(),
+            "time": ev.reminder_time.strftime("%H:%M"),
+            **ev.reminder_status,
+        },
+    }, ensure_ascii=False)
+    ev.dashboard_cache.update(version=cache.version, payload=payload)
+    return payload
+
+
+DASHBOARD_HTML = """<!doctype html>
+<html lang="ru"><head><meta charset="utf-8"><title>Занятость</title>
+<style>
+body{font-family:sans-serif;margin:20px}
+.day{margin-bottom:24px}
+.slots{display:flex;flex-wrap:wrap;gap:4px}
+.slot{padding:4px 8px;border-radius:4px;font-size:13px}
+.free{background:#dff5df}.booked{background:#f5d6d6}.pending{background:#fbeec1}
+.confirmed{outline:2px solid #4a4}
+#meta,#events{color:#666;font-size:13px}
+</style></head><body>
+<h2>Занятость мероприятия <span id="event"></span></h2>
+<div id="events"></div>
+<div id="meta">подключение…</div>
+<div id="days"></div>
+<script>
+const es = new EventSource("events" + location.search);
+es.onmessage = (e) => {
+  const s = JSON.parse(e.data);
+  const r = s.reminders;
+  document.getElementById("event").textContent = s.event;
+  document.getElementById("events").innerHTML = s.events.map(k => {
+    const q = new URLSearchParams(location.search);
+    q.set("event", k);
+    return k === s.event ? `<b>${k}</b>` : `<a href="?${q}">${k}</a>`;
+  }).join(" · ");
+  document.getElementById("meta").textContent =
+    `обновлено ${s.generated_at}, возраст снимка ${s.snapshot_age_s} с · ` +
+    `ждут подтверждения: ${s.pending.length} · напоминания ${r.day} ${r.time}: ` +
+    `отправлено ${r.sent}, не отправлено ${r.not_sent}, подтвердили ${r.confirmed}` +
+    (r.last_run ? ` · последняя рассылка ${r.last_run} (ok ${r.last_ok}, ошибок ${r.last_fail})` : "");
+  document.getElementById("days").innerHTML = s.days.map(d =>
+    `<div class="day"><h3>${d.label}: занято ${d.booked + d.pending} из ${d.total}` +
+    ` (ждут подтверждения ${d.pending})</h3><div class="slots">` +
+    d.slots.map(x => `<span class="slot ${x.state}${x.confirmed ? " confirmed" : ""}">${x.time}</span>`).join("") +
+    `</div></div>`).join("");
+};
+es.onerror = () => { document.getElementById("meta").textContent = "нет соединения, переподключаюсь…"; };
+</script></body></html>
+"""
+
+
+async def dashboard_redirect(request: web.Request):
+    raise web.HTTPFound(DASHBOARD_PATH + "/?" + request.query_string)
+
+
+async def dashboard_page(request: web.Request):
+    if not dashboard_authorized(request):
+        raise web.HTTPUnauthorized()
+    dashboard_event(request)
+    return web.Response(text=DASHBOARD_HTML, content_type="text/html")
+
+
+async def dashboard_json(request: web.Request):
+    if not dashboard_authorized(request):
+        raise web.HTTPUnauthorized()
+    return web.Response(text=dashboard_state(dashboard_event(request)), content_type="application/json")
+
+
+async def dashboard_events(request: web.Request):
+    """Server-sent events: полный снимок при подключении и после каждого изменения занятости."""
+    if not dashboard_authorized(request):
+        raise web.HTTPUnauthorized()
+    ev = dashboard_event(request)
+    cache = ev.availability
+
+    resp = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await resp.prepare(request)
+
+    version = None
+    try:
+        while True:
+            if version != cache.version:
+                version = cache.version
+                await resp.write(f"data: {dashboard_state(ev)}\n\n".encode("utf-8"))
+            else:
+                await resp.write(b": keep-alive\n\n")
+            await cache.wait_changed(version, DASHBOARD_HEARTBEAT)
+    except ConnectionResetError:
+        pass
+    return resp
+
+
+def setup_dashboard(app: web.Application):
+    if not DASHBOARD_TOKEN:
+        print("[dashboard] DASHBOARD_TOKEN не задан — дашборд выключен.")
+        return
+    # Относительный путь "events" в странице → маршруты без завершающего слэша.
+    app.router.add_get(DASHBOARD_PATH, dashboard_redirect)
+    app.router.add_get(DASHBOARD_PATH + "/", dashboard_page)
+    app.router.add_get(DASHBOARD_PATH + "/events", dashboard_events)
+    app.router.add_get(DASHBOARD_PATH + "/state", dashboard_json)
+
+
 # =========================
 # WEBHOOK LIFECYCLE
 # =========================
-async def on_startup(app: web.Application):
+async def start_event(ev: Event):
     try:
-        ensure_sheet_headers_ru_and_format()
+        ev.availability.apply(await run_blocking(prepare_event, ev))
     except Exception as e:
-        print(f"[format sheet] error: {e}")
+        print(f"[start_event] {ev.key} error: {e}")
 
-    load_bookings_from_sheet()
+
+async def on_startup(app: web.Application):
+    if DEDUPE_STORE_PATH:
+        try:
+            SEEN_UPDATES.load(DEDUPE_STORE_PATH)
+        except Exception as e:
+            print(f"[dedupe] load error: {e}")
+        app["dedupe_task"] = asyncio.create_task(dedupe_flush_loop())
+
+    # Мероприятия готовятся параллельно на общем пуле потоков.
+    await asyncio.gather(*(start_event(ev) for ev in EVENTS.values()))
 
     await bot.set_webhook(WEBHOOK_URL)
     print(f"Webhook set to: {WEBHOOK_URL}")
 
     app["reminder_task"] = asyncio.create_task(reminder_loop())
+    app["archive_task"] = asyncio.create_task(archive_loop())
+    app["reconcile_task"] = asyncio.create_task(reconcile_loop())
 
 
 async def on_shutdown(app: web.Application):
-    task = app.get("reminder_task")
-    if task:
-        task.cancel()
+    for key in ("reminder_task", "archive_task", "reconcile_task", "dedupe_task"):
+        task = app.get(key)
+        if task:
+            task.cancel()
+
+    if DEDUPE_STORE_PATH:
+        try:
+            SEEN_UPDATES.save(DEDUPE_STORE_PATH)
+        except Exception as e:
+            print(f"[dedupe] save error: {e}")
 
     try:
         await bot.delete_webhook(drop_pending_updates=False)
@@ -879,6 +3000,7 @@ async def main():
 
     SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=WEBHOOK_PATH)
     setup_application(app, dp, bot=bot)
+    setup_dashboard(app)
 
     runner = web.AppRunner(app)
     await runner.setup()